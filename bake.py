@@ -0,0 +1,156 @@
+"""
+Fast in-process rendering of the template.
+
+Generate a project like cookiecutter does but without leaving the current
+process. The templates are compiled once and cached between bakes (in memory
+and as Jinja bytecode in the temporary directory) and the files not needed for
+the chosen options are never written, instead of being removed afterwards by
+the post generation hook.
+
+Usage: python bake.py [key=value]*
+"""
+import os
+import shutil
+import sys
+from functools import lru_cache
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from subprocess import call
+
+from binaryornot.check import is_binary
+from cookiecutter.environment import StrictEnvironment
+from cookiecutter.exceptions import (
+    FailedHookException,
+    OutputDirExistsException,
+)
+from cookiecutter.generate import generate_context
+from cookiecutter.prompt import prompt_for_config
+from jinja2 import FileSystemBytecodeCache, FileSystemLoader
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_TEMPLATE = "{{cookiecutter.project_slug}}"
+
+
+@lru_cache(maxsize=None)
+def load_hook(name, template_dir=TEMPLATE_DIR):
+    """Import a hook script of the template as a module."""
+    path_ = os.path.join(template_dir, "hooks", name + ".py")
+    loader = SourceFileLoader(name, path_)
+    module = module_from_spec(spec_from_loader(name, loader))
+    loader.exec_module(module)
+    return module
+
+
+@lru_cache(maxsize=None)
+def get_environment(template_dir=TEMPLATE_DIR):
+    """Return the Jinja environment shared by all bakes of a template."""
+    return StrictEnvironment(
+        context={"cookiecutter": {}},
+        keep_trailing_newline=True,
+        loader=FileSystemLoader(template_dir),
+        bytecode_cache=FileSystemBytecodeCache(),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_path_template(path_, template_dir=TEMPLATE_DIR):
+    """Return the compiled template to render a path."""
+    return get_environment(template_dir).from_string(path_)
+
+
+def get_template_files(template_dir=TEMPLATE_DIR):
+    """Return the paths of the project template files."""
+    paths = []
+    for dirpath, __, filenames in os.walk(
+        os.path.join(template_dir, PROJECT_TEMPLATE)
+    ):
+        paths.extend(
+            os.path.relpath(os.path.join(dirpath, filename), template_dir)
+            for filename in filenames
+        )
+    return sorted(paths)
+
+
+def get_context(extra_context=None, template_dir=TEMPLATE_DIR):
+    """Return the cookiecutter context for the template and extra options."""
+    context = generate_context(
+        context_file=os.path.join(template_dir, "cookiecutter.json"),
+        extra_context=extra_context,
+    )
+    context["cookiecutter"] = prompt_for_config(context, no_input=True)
+    return context
+
+
+def get_newline(path_):
+    """Return the newline style of the first line of a text file."""
+    with open(path_, encoding="utf-8") as fo:
+        fo.readline()
+        newlines = fo.newlines
+    return newlines[0] if isinstance(newlines, tuple) else newlines
+
+
+def is_excluded(path_, excluded):
+    """Return True if path_ is or is inside any of the excluded paths."""
+    return any(
+        path_ == excluded_path or path_.startswith(excluded_path + os.sep)
+        for excluded_path in excluded
+    )
+
+
+def bake(
+    extra_context=None,
+    output_dir=".",
+    template_dir=TEMPLATE_DIR,
+    check_dependencies=False,
+):
+    """
+    Generate a project from the template and return its path.
+
+    Equivalent to cookiecutter with no input. Run verchew in the new project
+    if check_dependencies is True.
+    """
+    context = get_context(extra_context, template_dir)
+    options = context["cookiecutter"]
+    pre_gen_project = load_hook("pre_gen_project", template_dir)
+    post_gen_project = load_hook("post_gen_project", template_dir)
+    if not pre_gen_project.re.match(
+        pre_gen_project.MODULE_REGEX, options["project_slug"]
+    ):
+        msg = "The project slug ({}) is not a valid Python module name."
+        raise FailedHookException(msg.format(options["project_slug"]))
+    project_dir = os.path.join(
+        output_dir, get_path_template(PROJECT_TEMPLATE).render(**context)
+    )
+    if os.path.exists(project_dir):
+        msg = 'Error: "{}" directory already exists'.format(project_dir)
+        raise OutputDirExistsException(msg)
+    excluded = post_gen_project.get_excluded_paths(options)
+    renamed = post_gen_project.get_renamed_paths(options)
+    env = get_environment(template_dir)
+    for infile in get_template_files(template_dir):
+        path_ = get_path_template(infile, template_dir).render(**context)
+        path_ = os.path.relpath(path_, os.path.basename(project_dir))
+        if is_excluded(path_, excluded):
+            continue
+        for source, target in renamed.items():
+            if is_excluded(path_, [source]):
+                path_ = os.path.join(target, os.path.relpath(path_, source))
+        outfile = os.path.join(project_dir, path_)
+        os.makedirs(os.path.dirname(outfile), exist_ok=True)
+        infile_path = os.path.join(template_dir, infile)
+        if is_binary(infile_path):
+            shutil.copyfile(infile_path, outfile)
+        else:
+            template = env.get_template(infile.replace(os.sep, "/"))
+            newline = get_newline(infile_path)
+            with open(outfile, "w", encoding="utf-8", newline=newline) as fo:
+                fo.write(template.render(**context))
+        shutil.copymode(infile_path, outfile)
+    if check_dependencies:
+        verchew = os.path.join("bin", "verchew")
+        call([sys.executable, verchew], cwd=project_dir)
+    return project_dir
+
+
+if __name__ == "__main__":
+    print(bake(dict(arg.split("=", 1) for arg in sys.argv[1:])))
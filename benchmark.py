@@ -0,0 +1,171 @@
+"""
+Benchmark the generation of every combination of the template options.
+
+For each combination record the render time relative to a reference bake of
+the default options measured in the same worker, the number of files and the
+bytes written, and check that `doit list` loads in the generated project.
+The ratios don't depend on the speed of the machine, so the baseline can be
+compared across machines. The combinations are sharded across processes. The
+results are compared with the stored baseline and the script fails if any of
+them regress.
+
+Usage: python benchmark.py [--save] [--processes N]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import product
+from multiprocessing import Pool
+
+import bake
+
+BASELINE = os.path.join(bake.TEMPLATE_DIR, "benchmark.json")
+# A render time ratio is a regression if it exceeds the baseline by this factor
+TIME_TOLERANCE = 2.0
+# Best of this number of bakes for the render time and the reference time
+REPEAT = 3
+# An output size is a regression if it exceeds the baseline by this factor
+SIZE_TOLERANCE = 1.1
+
+
+def get_matrix(template_dir=bake.TEMPLATE_DIR):
+    """Return the extra context for every combination of choice options."""
+    with open(os.path.join(template_dir, "cookiecutter.json")) as fo:
+        context = json.load(fo)
+    choices = [
+        (key, value)
+        for key, value in context.items()
+        if isinstance(value, list) and not key.startswith("_")
+    ]
+    return [
+        dict(zip([key for key, __ in choices], values))
+        for values in product(*[value for __, value in choices])
+    ]
+
+
+def get_key(extra_context):
+    """Return the name of a combination for the reports."""
+    return "/".join(extra_context.values())
+
+
+def warm_up():
+    """Compile the templates in a worker before measuring."""
+    output_dir = tempfile.mkdtemp()
+    try:
+        bake.bake(output_dir=output_dir)
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def time_bake(extra_context, output_dir):
+    """Return the render time of a combination, removing the project after."""
+    start = time.perf_counter()
+    project = bake.bake(extra_context, output_dir=output_dir)
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(project)
+    return elapsed
+
+
+def measure(extra_context):
+    """Bake a combination of options and return its key and metrics."""
+    output_dir = tempfile.mkdtemp()
+    try:
+        reference = min(time_bake(None, output_dir) for __ in range(REPEAT))
+        elapsed = min(
+            time_bake(extra_context, output_dir) for __ in range(REPEAT)
+        )
+        project = bake.bake(extra_context, output_dir=output_dir)
+        files = size = 0
+        for dirpath, __, filenames in os.walk(project):
+            for filename in filenames:
+                files += 1
+                size += os.path.getsize(os.path.join(dirpath, filename))
+        doit_list = subprocess.run(
+            [sys.executable, "-m", "doit", "list"],
+            cwd=project,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+    finally:
+        shutil.rmtree(output_dir)
+    return (
+        get_key(extra_context),
+        {
+            "time_ratio": round(elapsed / reference, 2),
+            "files": files,
+            "bytes": size,
+            "doit_list": doit_list.returncode == 0,
+        },
+    )
+
+
+def run_matrix(matrix, processes=None):
+    """Measure all the combinations in a pool of processes."""
+    with Pool(processes, initializer=warm_up) as pool:
+        return dict(pool.imap_unordered(measure, matrix))
+
+
+def compare(results, baseline):
+    """Return the list of regressions of results against the baseline."""
+    errors = []
+    for key, result in sorted(results.items()):
+        if not result["doit_list"]:
+            errors.append("{}: doit list failed".format(key))
+        if key not in baseline:
+            continue
+        expected = baseline[key]
+        max_ratio = expected["time_ratio"] * TIME_TOLERANCE
+        if result["time_ratio"] > max_ratio:
+            msg = "{}: render time ratio {:.2f} exceeds {:.2f}"
+            errors.append(msg.format(key, result["time_ratio"], max_ratio))
+        for metric in ("files", "bytes"):
+            max_size = int(expected[metric] * SIZE_TOLERANCE)
+            if result[metric] > max_size:
+                msg = "{}: {} {} exceeds {}".format(
+                    key, metric, result[metric], max_size
+                )
+                errors.append(msg)
+    return errors
+
+
+def main(argv=None):
+    """Run the benchmark, save or compare it with the baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as baseline"
+    )
+    parser.add_argument(
+        "--processes", type=int, help="number of processes (default all CPUs)"
+    )
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    results = run_matrix(get_matrix(), args.processes)
+    line_ = "{:<60} {time_ratio:>5.2f}x {files:>4} files {bytes:>8} bytes"
+    for key, result in sorted(results.items()):
+        print(line_.format(key, **result))
+    msg = "{} combinations in {:.1f}s"
+    print(msg.format(len(results), time.perf_counter() - start))
+    if args.save:
+        with open(BASELINE, "w") as fo:
+            json.dump(results, fo, indent=4, sort_keys=True)
+            fo.write("\n")
+        return 0
+    try:
+        with open(BASELINE) as fo:
+            baseline = json.load(fo)
+    except OSError:
+        baseline = {}
+    errors = compare(results, baseline)
+    for error in errors:
+        print(error)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
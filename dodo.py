@@ -4,13 +4,30 @@ See: http://pydoit.org/
 Note: Install doit with python3, preferably in a virtual environment
 """
 import glob
+import hashlib
+import json
 import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
 import webbrowser
 from contextlib import contextmanager
+from datetime import datetime
+from fnmatch import fnmatch
+from functools import lru_cache
+from statistics import mean
 from subprocess import check_call, check_output
 from urllib.request import pathname2url
 
 from doit.exceptions import TaskFailed
+from doit.reporter import ConsoleReporter
+
+try:
+    import resource
+except ImportError:  # Not available in Windows
+    resource = None
 
 DOIT_CONFIG = {
     "default_tasks": ["format", "style", "test"],
@@ -19,38 +36,280 @@ DOIT_CONFIG = {
 }
 LINE_LENGHT = "79"  # black don't have a config file
 
-# Set file_dep to this to run task only when the code changes
-PYTHON_FILES = [
-    path for path in glob.iglob("**/*.py", recursive=True) if "{" not in path
-]
 
-# Set file_dep to this to run task only when the documentation changes
-DOCS_FILES = (
-    glob.glob("docs/**/*.md", recursive=True)
-    + glob.glob("*.md")
-    + ["{{cookiecutter.project_slug}}/docs/tasks.md"]
+# Directories never searched for source files. Keep in sync with the
+# [flake8] exclude and [isort] skip_glob options in tox.ini
+EXCLUDE_DIRS = (
+    "venv",
+    ".venv",
+    ".eggs",
+    ".git",
+    ".tox",
+    "build",
+    "dist",
+    "site",
+    "node_modules",
+    "htmlcov",
+    "{{cookiecutter.project_slug}}",
 )
+# Index of directory modification times to avoid listing unchanged ones
+FILES_INDEX = ".doit.db.files"
+
+# Set calc_dep to this to run task only when the code changes
+PYTHON_FILES = ["_python_files"]
+
+# Set calc_dep to this to run task only when the documentation changes
+DOCS_FILES = ["_docs_files"]
 
 BLACK_CMD = (
     "black -l "
     + LINE_LENGHT
-    + r' {diff} --exclude "(\.venv|\.git|\{{|\.tox|build|dist)" .'
+    + ' {diff} --exclude "/('
+    + "|".join(re.escape(dir_) for dir_ in EXCLUDE_DIRS)
+    .replace("{", "{{")
+    .replace("}", "}}")
+    + ')/" .'
 )
 COV_HTML = os.path.join("docs", "htmlcov")
 COV_INDEX = os.path.join(COV_HTML, "index.html")
 DOCS_HTML = "site"
 DOCS_INDEX = os.path.join(DOCS_HTML, "index.html")
 VERCHEW = os.path.join("bin", "verchew")
-GIT_LAST_VERSION_CMD = ["git", "describe", "--tags", "--abbrev=0"]
+GIT_LAST_VERSION_CMD = ["git", "describe", "--tags", "--long"]
 GIT_BRIEF_LOG_CMD = ["git", "--no-pager", "log", "--oneline"]
-GIT_UNSTAGED_CHANGES = ["git", "status", "--porcelain", "--untracked=no"]
-GIT_CURRENT_BRANCH_CMD = ["git", "rev-parse", "--abbrev-ref", "HEAD"]
+GIT_BRANCHES_CMD = ["git", "for-each-ref", "--format=%(refname:short)"]
+GIT_STATUS_CMD = [
+    "git",
+    "status",
+    "--porcelain=v2",
+    "--branch",
+    "--untracked-files=no",
+]
+
+# Append-only log (JSON lines) with the timing of every executed task
+TIMING_LOG = ".doit.db.timing"
+# Default number of runs summarized by the profile task
+PROFILE_RUNS = 10
+
+
+# -------------------- Profiling ------------------------
+
+
+def get_children_usage():
+    """Return CPU time and peak RSS (KiB) of the finished subprocesses."""
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+class TimingReporter(ConsoleReporter):
+    """
+    Console reporter that logs the timing of every executed task.
+
+    Append to TIMING_LOG the wall time of the task, the CPU time of its
+    subprocesses and their peak RSS. The resource usage of the subprocesses
+    is only known for the whole doit process, so the CPU time is not logged
+    for the tasks that overlapped with others. The peak RSS is a high-water
+    mark of all the subprocesses finished so far, it is only logged when the
+    task raised it without overlapping. Use `doit -n 0` to measure every task.
+    """
+
+    def __init__(self, outstream, options):
+        super().__init__(outstream, options)
+        self.run_id = datetime.now().isoformat()
+        self.started = {}
+        self.overlapped = set()
+
+    def execute_task(self, task):
+        if self.started:
+            self.overlapped.update(self.started, [task.name])
+        self.started[task.name] = (time.perf_counter(),) + (
+            get_children_usage()
+        )
+        super().execute_task(task)
+
+    def add_failure(self, task, exception):
+        self.log_task(task, "failure")
+        super().add_failure(task, exception)
+
+    def add_success(self, task):
+        self.log_task(task, "success")
+        super().add_success(task)
+
+    def log_task(self, task, status):
+        """Append the timing of a finished task to TIMING_LOG."""
+        if task.name not in self.started or task.name == "profile":
+            return
+        start, cpu_start, rss_start = self.started.pop(task.name)
+        cpu, rss = get_children_usage()
+        if cpu is None or task.name in self.overlapped:
+            cpu = rss = None
+        else:
+            cpu = round(cpu - cpu_start, 3)
+            rss = rss if rss > rss_start else None
+        self.overlapped.discard(task.name)
+        entry = {
+            "run": self.run_id,
+            "task": task.name,
+            "status": status,
+            "wall": round(time.perf_counter() - start, 3),
+            "cpu": cpu,
+            "rss": rss,
+            "task_dep": task.task_dep,
+        }
+        with open(TIMING_LOG, "a") as fo:
+            fo.write(json.dumps(entry) + "\n")
+
+
+DOIT_CONFIG["reporter"] = TimingReporter
+
+
+def read_timing_log(runs):
+    """Return the task entries of the last runs in TIMING_LOG by name."""
+    log = {}
+    try:
+        with open(TIMING_LOG) as fo:
+            for line in fo:
+                entry = json.loads(line)
+                log.setdefault(entry["run"], {})[entry["task"]] = entry
+    except OSError:
+        return []
+    return [log[run_id] for run_id in sorted(log)[-runs:]]
+
+
+def get_critical_path(entries):
+    """Return the duration and tasks of the slowest task_dep chain."""
+    paths = {}
+
+    def visit(name):
+        if name not in paths:
+            duration, path = max(
+                (
+                    visit(dep)
+                    for dep in entries[name]["task_dep"]
+                    if dep in entries
+                ),
+                default=(0.0, []),
+            )
+            paths[name] = (duration + entries[name]["wall"], path + [name])
+        return paths[name]
+
+    return max((visit(name) for name in entries), default=(0.0, []))
+
+
+def show_profile(runs):
+    """Print the slowest tasks, their trends and the critical path."""
+    log = read_timing_log(runs)
+    if not log:
+        print("No timing data in {}, run some tasks first.".format(TIMING_LOG))
+        return
+    tasks = {}
+    for entries in log:
+        for name, entry in entries.items():
+            tasks.setdefault(name, []).append(entry)
+    ranking = sorted(
+        tasks.items(), key=lambda item: -mean(e["wall"] for e in item[1])
+    )
+    print("Slowest tasks (mean of the last {} runs):".format(len(log)))
+    print("  (cpu and rss only of the runs not overlapped by other tasks)")
+    for name, entries in ranking[:10]:
+        cpus = [e["cpu"] for e in entries if e["cpu"] is not None]
+        rsss = [e["rss"] for e in entries if e["rss"] is not None]
+        print(
+            "  {:<24} {:>8.2f}s wall {:>9} cpu {:>9} KiB rss".format(
+                name,
+                mean(entry["wall"] for entry in entries),
+                "{:.2f}s".format(mean(cpus)) if cpus else "-",
+                max(rsss) if rsss else "-",
+            )
+        )
+    print("Trends (wall time of each run, oldest first):")
+    for name, entries in ranking:
+        if len(entries) > 1:
+            walls = " ".join("{:.2f}".format(e["wall"]) for e in entries)
+            print("  {:<24} {}".format(name, walls))
+    duration, path = get_critical_path(log[-1])
+    print("Critical path of the last run ({:.2f}s):".format(duration))
+    print("  " + " -> ".join(path))
 
 
 # --------------------- Actions ------------------------
 
 
-def get_subtask(cmd_action, file_dep=None):
+def walk_files(top, index):
+    """
+    Yield the path of every file under top, skipping EXCLUDE_DIRS.
+
+    index maps each directory to its mtime and the names of its files and
+    subdirectories. Only the directories with a different mtime are listed
+    again. The entries of the directories not found are removed.
+    """
+    visited = set()
+    pending = [top]
+    while pending:
+        dirpath = pending.pop()
+        visited.add(dirpath)
+        mtime = os.stat(dirpath).st_mtime_ns
+        entry = index.get(dirpath)
+        if entry is None or entry[0] != mtime:
+            files, dirs = [], []
+            for dir_entry in os.scandir(dirpath):
+                if not dir_entry.is_dir(follow_symlinks=False):
+                    files.append(dir_entry.name)
+                elif not any(fnmatch(dir_entry.name, p) for p in EXCLUDE_DIRS):
+                    dirs.append(dir_entry.name)
+            entry = index[dirpath] = [mtime, files, dirs]
+        for name in entry[1]:
+            yield os.path.normpath(os.path.join(dirpath, name))
+        pending.extend(os.path.join(dirpath, name) for name in entry[2])
+    for dirpath in set(index) - visited:
+        del index[dirpath]
+
+
+def find_files(top, *patterns):
+    """
+    Return the sorted paths of the files under top matching any pattern.
+
+    The directories index is persisted between runs in a FILES_INDEX file of
+    its own for each top, so the calc_deps running in parallel processes don't
+    overwrite the index of each other.
+    """
+    if not os.path.isdir(top):
+        return []
+    top_key = hashlib.md5(os.path.normpath(top).encode()).hexdigest()[:12]
+    index_path = FILES_INDEX + "." + top_key
+    try:
+        with open(index_path) as fo:
+            index = json.load(fo)
+    except (OSError, ValueError):
+        index = {}
+    paths = sorted(
+        path_
+        for path_ in walk_files(top, index)
+        if any(fnmatch(os.path.basename(path_), p) for p in patterns)
+    )
+    fd, tmp_path = tempfile.mkstemp(dir=".")
+    with os.fdopen(fd, "w") as fo:
+        json.dump(index, fo)
+    os.replace(tmp_path, index_path)
+    return paths
+
+
+def find_python_files():
+    """Return the Python files as a calc_dep result."""
+    return {"file_dep": find_files(".", "*.py")}
+
+
+def find_docs_files():
+    """Return the documentation files as a calc_dep result."""
+    root_docs = glob.glob("*.md") + [
+        "{{cookiecutter.project_slug}}/docs/tasks.md"
+    ]
+    return {"file_dep": find_files("docs", "*.md") + root_docs}
+
+
+def get_subtask(cmd_action, file_dep=None, calc_dep=None):
     """Return a dictionary defining a substack for string 'cmd_action'."""
     if cmd_action.startswith("poetry run "):
         name = cmd_action.split(" ")[2]
@@ -59,6 +318,8 @@ def get_subtask(cmd_action, file_dep=None):
     task = {"name": name, "actions": [cmd_action], "task_dep": ["install"]}
     if file_dep is not None:
         task["file_dep"] = file_dep
+    if calc_dep is not None:
+        task["calc_dep"] = calc_dep
     return task
 
 
@@ -73,15 +334,84 @@ def get_stdout(command):
     return check_output(command, universal_newlines=True)
 
 
+@lru_cache(maxsize=None)
+def get_git_status():
+    """
+    Return the current branch and True if the working tree is clean.
+
+    Both are read from a single git status call, memoized for the doit run.
+    """
+    branch, is_clean = None, True
+    for line_ in get_stdout(GIT_STATUS_CMD).splitlines():
+        if line_.startswith("# branch.head "):
+            branch = line_.split(" ")[2]
+        elif not line_.startswith("#"):
+            is_clean = False
+    return branch, is_clean
+
+
+@lru_cache(maxsize=None)
+def get_git_branches():
+    """Return the list of local branches, memoized."""
+    return get_stdout(GIT_BRANCHES_CMD + ["refs/heads"]).split()
+
+
+def get_last_version(branch):
+    """Return the last version tag of branch and the commits count since."""
+    description = get_stdout(GIT_LAST_VERSION_CMD + [branch]).strip()
+    tag, count, _ = description.rsplit("-", 2)
+    return tag, int(count)
+
+
+def get_venv_python():
+    """Return the path of the Python in the project virtual environment."""
+    code = "import sys; print(sys.executable)"
+    return get_stdout(["poetry", "run", "python", "-c", code]).strip()
+
+
+def get_worktree_path(branch):
+    """Return the path of the worktree with branch checked out or None."""
+    path_ = None
+    worktrees = get_stdout(["git", "worktree", "list", "--porcelain"])
+    for line_ in worktrees.splitlines():
+        if line_.startswith("worktree "):
+            path_ = line_.split(" ", 1)[1]
+        elif line_ == "branch refs/heads/" + branch:
+            return path_
+    return None
+
+
+def is_worktree_clean(branch):
+    """Return False if branch is checked out in a worktree with changes."""
+    path_ = get_worktree_path(branch)
+    if path_ is None:
+        return True
+    return not get_stdout(["git", "-C", path_, "status", "--porcelain"])
+
+
 @contextmanager
-def checkout(branch):
-    """Temporarily checkout to branch."""
-    current_branch = get_stdout(GIT_CURRENT_BRANCH_CMD).strip("\n\r ")
+def worktree(branch):
+    """
+    Yield the path of a working tree with branch checked out.
+
+    If the branch is not checked out, it is temporarily checked out in a new
+    git worktree, so the current working tree is not modified and the doit
+    file_dep states stay valid. Else git refuses a second checkout and the
+    existing worktree (maybe the current one) is used, the tasks check before
+    that it is clean.
+    """
+    path_ = get_worktree_path(branch)
+    if path_ is not None:
+        yield path_
+        return
+    temp_dir = tempfile.mkdtemp()
+    path_ = os.path.join(temp_dir, "worktree")
     try:
-        check_call(["git", "checkout", branch])
-        yield current_branch
+        check_call(["git", "worktree", "add", path_, branch])
+        yield path_
     finally:
-        check_call(["git", "checkout", current_branch])
+        shutil.rmtree(temp_dir)
+        check_call(["git", "worktree", "prune"])
 
 
 def check_merge(task):
@@ -92,17 +422,15 @@ def check_merge(task):
     """
     task.error = None
     branch = task.pos_arg_val[0] if len(task.pos_arg_val) > 0 else "master"
-    branches = [
-        branch_.strip("* \r")
-        for branch_ in get_stdout(["git", "branch"]).strip("\n\r ").split("\n")
-    ]
-    current_branch = get_stdout(GIT_CURRENT_BRANCH_CMD).strip("\n\r ")
-    if branch not in branches:
+    current_branch, is_clean = get_git_status()
+    if branch not in get_git_branches():
         task.error = "Branch {} don't exist.".format(branch)
     elif current_branch == branch:
         task.error = "Source and targets branch are the same."
-    elif len(get_stdout(GIT_UNSTAGED_CHANGES)) > 0:
+    elif not is_clean:
         task.error = "Git working directory is not clean."
+    elif not is_worktree_clean(branch):
+        task.error = "Git worktree of {} is not clean.".format(branch)
     else:
         branch_diff = get_stdout(["git", "diff", "--name-only", branch])
         return len(branch_diff) == 0
@@ -114,31 +442,36 @@ def do_merge(task, pos_arg_val):
     if task.error is not None:
         return TaskFailed(task.error)
     branch = pos_arg_val[0] if len(pos_arg_val) > 0 else "master"
-    with checkout(branch) as current_branch:
-        check_call(["git", "merge", "--no-ff", current_branch])
-        check_call(["git", "push", "origin", branch])
+    current_branch = get_git_status()[0]
+    with worktree(branch) as path_:
+        try:
+            check_call(["git", "merge", "--no-ff", current_branch], cwd=path_)
+        except subprocess.CalledProcessError:
+            check_call(["git", "merge", "--abort"], cwd=path_)
+            msg = (
+                "Merge of {0} into {1} failed. Run 'git merge {1}' in {0}, "
+                "resolve the conflicts, commit and run the task again."
+            )
+            return TaskFailed(msg.format(current_branch, branch))
+        check_call(["git", "push", "origin", branch], cwd=path_)
 
 
 def check_release(task):
     """
     Return uptodate (True) if there aren't unreleased commit in master branch.
 
-    First, check there aren't unstaged changes in master and current branches
-    and pass the error to do_release.
+    First, check there aren't unstaged changes in the current branch or in the
+    master worktree and pass the error to do_release.
     """
     task.error = None
-    if len(get_stdout(GIT_UNSTAGED_CHANGES)) > 0:
+    if not get_git_status()[1]:
         task.error = "Git working directory is not clean."
         return False
-    with checkout("master"):
-        if len(get_stdout(GIT_UNSTAGED_CHANGES)) > 0:
-            task.error = "Git working directory is not clean."
-            return False
-        task.last_version = get_stdout(GIT_LAST_VERSION_CMD).strip("\n\r ")
-        task.unreleased_commits = get_stdout(
-            GIT_BRIEF_LOG_CMD + [task.last_version + ".."]
-        )
-    return len(task.unreleased_commits) == 0
+    if not is_worktree_clean("master"):
+        task.error = "Git worktree of master is not clean."
+        return False
+    task.last_version, unreleased_count = get_last_version("master")
+    return unreleased_count == 0
 
 
 def do_release(task, pos_arg_val):
@@ -152,19 +485,22 @@ def do_release(task, pos_arg_val):
     part = pos_arg_val[0]
     if part not in choices:
         return TaskFailed(msg.format("Wrong", str(choices)))
-    with checkout("master"):
+    current_branch = get_git_status()[0]
+    bump_cmd = [get_venv_python(), "-m", "bumpversion"]
+    with worktree("master") as path_:
         print("Commits since", task.last_version)
-        print(task.unreleased_commits)
-        check_call(["poetry", "run", "bump2version", "-n", "--verbose", part])
+        print(get_stdout(GIT_BRIEF_LOG_CMD + [task.last_version + "..master"]))
+        check_call(bump_cmd + ["-n", "--verbose", part], cwd=path_)
         proceed = input("Do you agree with the changes? (y/n): ")
         if proceed.lower().strip().startswith("y"):
-            check_call(["poetry", "run", "bump2version", part])
-            check_call(["git", "push", "--tags", "origin", "master"])
+            check_call(bump_cmd + [part], cwd=path_)
+            push_cmd = ["git", "push", "--tags", "origin", "master"]
+            check_call(push_cmd, cwd=path_)
         else:
             return TaskFailed("Cancelled by user.")
-    check_call(["git", "merge", "--no-ff", "master"])
-    current_branch = get_stdout(GIT_CURRENT_BRANCH_CMD).strip("\n\r ")
-    check_call(["git", "push", "origin", current_branch])
+    if current_branch != "master":
+        check_call(["git", "merge", "--no-ff", "master"])
+        check_call(["git", "push", "origin", current_branch])
 
 
 # ------------------- Installation ---------------------
@@ -191,16 +527,26 @@ def task_install():
 # --------------------- Development ----------------------
 
 
+def task__python_files():
+    """Find the Python files. Use it through the PYTHON_FILES calc_dep."""
+    return {"actions": [find_python_files]}
+
+
+def task__docs_files():
+    """Find the documentation files. Use it through the DOCS_FILES calc_dep."""
+    return {"actions": [find_docs_files]}
+
+
 def task_check():
     """Show the changes that the code formatters would apply."""
     for action in [BLACK_CMD.format(diff="--diff"), "poetry run isort --diff"]:
-        yield get_subtask(action, PYTHON_FILES)
+        yield get_subtask(action, calc_dep=PYTHON_FILES)
 
 
 def task_format():
     """Run code formatters and apply it's changes."""
     for action in [BLACK_CMD.format(diff=""), "poetry run isort -y"]:
-        yield get_subtask(action, PYTHON_FILES)
+        yield get_subtask(action, calc_dep=PYTHON_FILES)
 
 
 def task_style():
@@ -210,14 +556,14 @@ def task_style():
         "poetry run pydocstyle",
         "poetry run isort --check-only -rc .",
     ]:
-        yield get_subtask(action, PYTHON_FILES)
+        yield get_subtask(action, calc_dep=PYTHON_FILES)
 
 
 def task_test():
     """Run tests."""
     return {
         "task_dep": ["install"],
-        "file_dep": PYTHON_FILES,
+        "calc_dep": PYTHON_FILES,
         "actions": ["poetry run pytest"],
     }
 
@@ -227,11 +573,20 @@ def task_test_all():
     return {
         "basename": "test-all",
         "task_dep": ["install"],
-        "file_dep": PYTHON_FILES,
+        "calc_dep": PYTHON_FILES,
         "actions": ["poetry run tox"],
     }
 
 
+def task_benchmark():
+    """Bake every combination of options and compare with the baseline."""
+    return {
+        "task_dep": ["install"],
+        "actions": ["poetry run python benchmark.py"],
+        "verbosity": 2,
+    }
+
+
 def task_coverage():
     """Generate and show the coverage html report."""
     yield {
@@ -253,7 +608,7 @@ def task_docs():
     yield {
         "name": "build",
         "task_dep": ["install"],
-        "file_dep": DOCS_FILES,
+        "calc_dep": DOCS_FILES,
         "actions": ["poetry run mkdocs build"],
         "targets": [DOCS_HTML, DOCS_INDEX],
     }
@@ -273,6 +628,24 @@ def task_serve_docs():
     }
 
 
+def task_profile():
+    """Show the slowest tasks, their trends and the critical path."""
+    return {
+        "actions": [show_profile],
+        "params": [
+            {
+                "name": "runs",
+                "short": "r",
+                "long": "runs",
+                "type": int,
+                "default": PROFILE_RUNS,
+                "help": "number of last runs to summarize",
+            }
+        ],
+        "uptodate": [False],
+    }
+
+
 # -------------------- Release ------------------------
 
 
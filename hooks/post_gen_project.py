@@ -2,27 +2,61 @@ import os
 import shutil
 import subprocess
 
+
+def get_excluded_paths(context):
+    """Return the project paths not needed for the chosen options."""
+    slug = context["project_slug"]
+    excluded = []
+    if context["license"] == "Not open source":
+        excluded.append("LICENSE")
+    if context["docs_generator"] == "Sphinx":
+        excluded.extend(["docs", "mkdocs.yml"])
+    else:
+        excluded.extend(
+            [
+                "sphinx",
+                os.path.join("bin", "serve-docs"),
+                os.path.join("bin", "docs_helpers.py"),
+            ]
+        )
+    if context["command_line_interface"] == "No command-line interface":
+        excluded.extend(
+            [
+                os.path.join(slug, "cli.py"),
+                os.path.join(slug, "__main__.py"),
+                os.path.join("bin", "benchmark-cli"),
+                os.path.join("tests", "test_cli.py"),
+            ]
+        )
+    if context["continous_integration"] != "Travis":
+        excluded.append(".travis.yml")
+    if context["continous_integration"] != "CircleCI":
+        excluded.append(".circleci")
+    return excluded
+
+
+def get_renamed_paths(context):
+    """Return a dictionary with the project paths to rename."""
+    if context["docs_generator"] == "Sphinx":
+        return {"sphinx": "docs"}
+    return {}
+
+
 if __name__ == "__main__":
+    context = {
+        "project_slug": "{{ cookiecutter.project_slug }}",
+        "license": "{{ cookiecutter.license }}",
+        "docs_generator": "{{ cookiecutter.docs_generator }}",
+        "command_line_interface": "{{ cookiecutter.command_line_interface }}",
+        "continous_integration": "{{ cookiecutter.continous_integration }}",
+    }
     project_directory = os.path.realpath(os.path.curdir)
     os.chdir(project_directory)
-    if "{{ cookiecutter.license }}" == "Not open source":
-        os.remove("LICENSE")
     subprocess.run(["python", os.path.join("bin", "verchew")])
-    if "{{ cookiecutter.docs_generator }}" == "Sphinx":
-        shutil.rmtree("docs")
-        os.rename("sphinx", "docs")
-        os.remove("mkdocs.yml")
-    else:
-        shutil.rmtree("sphinx")
-        os.remove(os.path.join("bin", "serve-docs"))
-    cli = "{{ cookiecutter.command_line_interface }}"
-    if cli == "No command-line interface":
-        os.remove(os.path.join("{{ cookiecutter.project_slug }}", "cli.py"))
-        os.remove(
-            os.path.join("{{ cookiecutter.project_slug }}", "__main__.py")
-        )
-        os.remove(os.path.join("tests", "test_cli.py"))
-    if "{{ cookiecutter.continous_integration }}" != "Travis":
-        os.remove(os.path.join(".travis.yml"))
-    if "{{ cookiecutter.continous_integration }}" != "CircleCI":
-        shutil.rmtree(".circleci")
+    for path_ in get_excluded_paths(context):
+        if os.path.isdir(path_):
+            shutil.rmtree(path_)
+        else:
+            os.remove(path_)
+    for source, target in get_renamed_paths(context).items():
+        os.rename(source, target)
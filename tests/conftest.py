@@ -0,0 +1,45 @@
+"""Shared fixtures for tests."""
+
+import json
+import shutil
+
+import py
+import pytest
+
+import bake
+
+
+@pytest.fixture(scope="session")
+def bake_project(tmp_path_factory):
+    """
+    Return a function to bake a project once per session.
+
+    Projects are cached by their extra context and shared between tests, so
+    they must be treated as read-only. Under pytest-xdist each worker gets its
+    own base temporary directory and therefore its own projects.
+    """
+    projects = {}
+
+    def _bake_project(extra_context=None):
+        key = json.dumps(extra_context or {}, sort_keys=True)
+        if key not in projects:
+            output_dir = tmp_path_factory.mktemp("baked")
+            project = bake.bake(extra_context, output_dir=str(output_dir))
+            projects[key] = py.path.local(project)
+        return projects[key]
+
+    return _bake_project
+
+
+@pytest.fixture
+def bake_copy(bake_project, tmp_path_factory):
+    """Return a function to get a writable copy of a session project."""
+
+    def _bake_copy(extra_context=None):
+        project = bake_project(extra_context)
+        target = py.path.local(tmp_path_factory.mktemp("copy"))
+        target = target.join(project.basename)
+        shutil.copytree(str(project), str(target), symlinks=True)
+        return target
+
+    return _bake_copy
@@ -0,0 +1,44 @@
+import benchmark
+
+
+def test_get_matrix():
+    matrix = benchmark.get_matrix()
+    assert len(matrix) == 5 * 2 * 2 * 3
+    assert len({benchmark.get_key(options) for options in matrix}) == 60
+    assert matrix[0] == {
+        "license": "MIT",
+        "docs_generator": "MkDocs",
+        "command_line_interface": "Click",
+        "continous_integration": "Travis",
+    }
+
+
+def test_measure():
+    key, result = benchmark.measure(benchmark.get_matrix()[0])
+    assert key == "MIT/MkDocs/Click/Travis"
+    assert result["time_ratio"] > 0
+    assert result["files"] > 0
+    assert result["bytes"] > 0
+    assert result["doit_list"]
+
+
+def test_compare():
+    baseline = {
+        "a": {"time_ratio": 1.0, "files": 10, "bytes": 100, "doit_list": True}
+    }
+    results = {
+        "a": {"time_ratio": 1.5, "files": 11, "bytes": 110, "doit_list": True},
+        "b": {"time_ratio": 9.0, "files": 99, "bytes": 999, "doit_list": True},
+    }
+    assert benchmark.compare(results, baseline) == []
+    results["a"] = {
+        "time_ratio": 3,
+        "files": 12,
+        "bytes": 111,
+        "doit_list": False,
+    }
+    errors = benchmark.compare(results, baseline)
+    assert errors[0] == "a: doit list failed"
+    assert errors[1].startswith("a: render time ratio")
+    assert errors[2] == "a: files 12 exceeds 11"
+    assert errors[3] == "a: bytes 111 exceeds 110"
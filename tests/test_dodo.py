@@ -1,19 +1,24 @@
 import importlib
+import json
+import os
 import subprocess
+import sys
 from datetime import datetime
+from subprocess import PIPE, STDOUT
 
+import coverage
 import mock
 import pytest
 from doit.cmd_base import ModuleTaskLoader
 from doit.doit_cmd import DoitMain
+from doit.exceptions import TaskFailed
 
 import dodo
 from tests.utils import inside_dir, poetryenv_in_project
 
 
-def test_clean_paths(cookies):
-    result = cookies.bake()
-    project = result.project
+def test_clean_paths(bake_project):
+    project = bake_project()
     with inside_dir(project):
         importlib.reload(dodo)
         with mock.patch("dodo.os") as m_os:
@@ -32,19 +37,214 @@ def test_clean_paths(cookies):
     importlib.reload(dodo)
 
 
-def test_copy_directory(cookies):
-    result = cookies.bake()
-    project = result.project
+def test_update_directory(bake_project, tmpdir):
+    project = bake_project({"docs_generator": "Sphinx"})
     with inside_dir(project):
         importlib.reload(dodo)
-        with mock.patch("dodo.os") as m_os:
-            with mock.patch("dodo.shutil") as m_shutil:
-                m_os.path.join = lambda *paths: "/".join(paths)
-                m_os.path.basename.return_value = "b"
-                m_os.path.isdir.side_effect = [True, True]
-                m_os.path.exists.return_value = False
-                dodo.copy_directory("a/b", "c")
-                m_shutil.copytree.called_once_with("a/b", "c/b")
+    source = tmpdir.mkdir("htmlcov")
+    source.join("index.html").write("foo")
+    site = tmpdir.mkdir("site")
+    assert dodo.update_directory(str(source), str(site))
+    assert site.join("htmlcov", "index.html").read() == "foo"
+    site.join("htmlcov", "other.html").write("")
+    assert not dodo.update_directory(str(source), str(site))
+    assert site.join("htmlcov", "other.html").check(file=1)
+    source.join("index.html").write("bar")
+    assert dodo.update_directory(str(source), str(site))
+    assert site.join("htmlcov", "index.html").read() == "bar"
+    assert not site.join("htmlcov", "other.html").check()
+    importlib.reload(dodo)
+
+
+def test_update_apidoc(bake_project, tmpdir):
+    project = bake_project({"docs_generator": "Sphinx"})
+    with inside_dir(project):
+        importlib.reload(dodo)
+    api_dir = tmpdir.mkdir("api")
+    api_dir.join("index.rst").write("index")
+    api_dir.join("foo.old.rst").write("old")
+    api_dir.join("foo.rst").write("foo")
+    mtime = api_dir.join("foo.rst").mtime() - 10
+    api_dir.join("foo.rst").setmtime(mtime)
+
+    def apidoc(cmd):
+        tmp_dir = cmd[-2]
+        for name, content in [
+            ("modules.rst", "modules"),
+            ("foo.rst", "foo"),
+            ("foo.bar.rst", "bar"),
+        ]:
+            with open(os.path.join(tmp_dir, name), "w") as fo:
+                fo.write(content)
+
+    with mock.patch("dodo.check_call", side_effect=apidoc) as m_cc:
+        dodo.update_apidoc("foo", str(api_dir), dodo.run_apidoc)
+        assert m_cc.call_args[0][0][:5] == [
+            "poetry",
+            "run",
+            "sphinx-apidoc",
+            "-q",
+            "-o",
+        ]
+    assert sorted(api_dir.listdir()) == [
+        api_dir.join(name)
+        for name in ("foo.bar.rst", "foo.rst", "index.rst", "modules.rst")
+    ]
+    assert api_dir.join("foo.rst").mtime() == mtime
+    importlib.reload(dodo)
+
+
+def test_find_files(bake_copy):
+    project = bake_copy({"project_name": "mypackage"})
+    with inside_dir(project):
+        importlib.reload(dodo)
+        project.mkdir(".venv").join("foo.py").write("")
+        python_files = dodo.find_files(".", "*.py")
+        assert "dodo.py" in python_files
+        assert "mypackage/mypackage.py" in python_files
+        assert ".venv/foo.py" not in python_files
+        assert project.listdir(dodo.FILES_INDEX + ".*")
+        assert not project.listdir("tmp*")
+        project.join("mypackage", "dummy.py").write("")
+        python_files = dodo.find_files(".", "*.py")
+        assert "mypackage/dummy.py" in python_files
+        project.join("mypackage", "dummy.py").remove()
+        python_files = dodo.find_files(".", "*.py")
+        assert "mypackage/dummy.py" not in python_files
+        assert dodo.find_python_files() == {"file_dep": python_files}
+        dodo.find_files("mypackage", "*")
+        assert len(project.listdir(dodo.FILES_INDEX + ".*")) == 2
+    importlib.reload(dodo)
+
+
+def test_split_lint_output(bake_project):
+    project = bake_project()
+    with inside_dir(project):
+        importlib.reload(dodo)
+        output = "\n".join(
+            [
+                "warning",
+                "a.py:1 in public function `foo`:",
+                "        D400: First line should end with a period",
+                "ERROR: {} Imports are incorrectly sorted.".format(
+                    os.path.abspath("b.py")
+                ),
+            ]
+        )
+        report = dodo.split_lint_output(output, ["a.py", "b.py", "c.py"])
+        assert len(report["a.py"]) == 2
+        assert len(report["b.py"]) == 1
+        assert report["c.py"] == []
+    importlib.reload(dodo)
+
+
+def test_lint_changed(bake_copy, capsys, tmpdir):
+    project = bake_copy({"project_name": "mypackage"})
+    with inside_dir(project):
+        importlib.reload(dodo)
+        dodo.RESULT_CACHE = str(tmpdir)
+        files = ["dodo.py", "mypackage/cli.py"]
+        with mock.patch("dodo.run") as m_run:
+            m_run.return_value.returncode = 1
+            m_run.return_value.stdout = "dodo.py:1:1: E111 bad"
+            failed = dodo.lint_changed("lint", "lint", None, files)
+            assert isinstance(failed, TaskFailed)
+            m_run.assert_called_once_with(
+                ["lint"] + files,
+                stdout=PIPE,
+                stderr=STDOUT,
+                universal_newlines=True,
+            )
+            m_run.reset_mock()
+            failed = dodo.lint_changed("lint", "lint", None, files)
+            assert isinstance(failed, TaskFailed)
+            assert not m_run.called
+            project.join("dodo.py").write("\n", mode="a")
+            m_run.return_value.returncode = 0
+            m_run.return_value.stdout = ""
+            assert dodo.lint_changed("lint", "lint", None, files) is None
+            m_run.assert_called_once_with(
+                ["lint", "dodo.py"],
+                stdout=PIPE,
+                stderr=STDOUT,
+                universal_newlines=True,
+            )
+        assert "E111" in capsys.readouterr().out
+    importlib.reload(dodo)
+
+
+def test_run_cached(bake_copy, capsys, tmpdir):
+    project = bake_copy()
+    with inside_dir(project):
+        importlib.reload(dodo)
+        cache = tmpdir.mkdir("cache")
+        dodo.RESULT_CACHE = str(cache)
+        dodo.get_venv_version = mock.MagicMock(return_value="Python 3.7.1")
+        cmd = "echo foo && echo bar > out.txt"
+        assert dodo.run_cached(cmd, ["out.txt"], ["dodo.py"]) is None
+        assert capsys.readouterr().out == "foo\n"
+        project.join("out.txt").remove()
+        with mock.patch("dodo.Popen") as m_popen:
+            assert dodo.run_cached(cmd, ["out.txt"], ["dodo.py"]) is None
+            assert not m_popen.called
+        assert capsys.readouterr().out == "foo\n"
+        assert project.join("out.txt").read() == "bar\n"
+        failed = dodo.run_cached("exit 1", [], ["dodo.py"])
+        assert isinstance(failed, TaskFailed)
+        assert len(cache.listdir()) == 1
+        cmd = "echo $FOO > out.1 && echo $FOO > out.2"
+        env = {"FOO": "bar"}
+        assert dodo.run_cached(cmd, ["out.*"], ["dodo.py"], env) is None
+        project.join("out.1").remove()
+        project.join("out.2").write("foo")
+        assert dodo.run_cached(cmd, ["out.*"], ["dodo.py"], env) is None
+        assert project.join("out.1").read() == "bar\n"
+        assert project.join("out.2").read() == "bar\n"
+        assert len(cache.listdir()) == 2
+        cmd = "mkdir -p dist && echo bar > dist/out.txt"
+        assert dodo.run_cached(cmd, ["dist/*.txt"], ["dodo.py"]) is None
+        project.join("dist").remove()
+        assert dodo.run_cached(cmd, ["dist/*.txt"], ["dodo.py"]) is None
+        assert project.join("dist", "out.txt").read() == "bar\n"
+        dodo.get_venv_version.return_value = "Python 3.8.0"
+        with mock.patch("dodo.Popen") as m_popen:
+            m_popen.return_value.wait.return_value = 0
+            dodo.run_cached(cmd, ["dist/*.txt"], ["dodo.py"])
+            assert m_popen.called
+    importlib.reload(dodo)
+
+
+def test_prune_result_cache(bake_project, tmpdir):
+    with inside_dir(bake_project()):
+        importlib.reload(dodo)
+        dodo.RESULT_CACHE = str(tmpdir)
+        for i, name in enumerate(["a", "b", "c"]):
+            os.utime(str(tmpdir.mkdir(name)), (i, i))
+        tmpdir.join("lint-style.json").write("{}")
+        dodo.prune_result_cache(2)
+        assert sorted(tmpdir.listdir()) == [
+            tmpdir.join("b"),
+            tmpdir.join("c"),
+            tmpdir.join("lint-style.json"),
+        ]
+    importlib.reload(dodo)
+
+
+def test_find_package_files(bake_copy):
+    project = bake_copy({"project_name": "mypackage"})
+    with inside_dir(project):
+        importlib.reload(dodo)
+        project.join("mypackage", "cli.pyc").write("")
+        file_dep = dodo.find_package_files()["file_dep"]
+        assert "mypackage/cli.py" in file_dep
+        assert "mypackage/cli.pyc" not in file_dep
+        assert "pyproject.toml" in file_dep
+        assert "tests/test_cli.py" not in file_dep
+        assert dodo.get_version() == "0.1.0"
+        assert (
+            dodo.get_dist_pattern(".tar.gz") == "dist/mypackage-0.1.0.tar.gz"
+        )
+    importlib.reload(dodo)
 
 
 def test_get_subtask_defaults():
@@ -61,49 +261,445 @@ def test_get_subtask_with_file_dep():
     assert task["file_dep"] == "taz"
 
 
+def test_get_subtask_with_calc_dep():
+    task = dodo.get_subtask("foo bar", calc_dep=["taz"])
+    assert task["calc_dep"] == ["taz"]
+    assert "file_dep" not in task
+
+
 def test_get_subtask_with_poetry():
     task = dodo.get_subtask("poetry run foo bar")
     assert task["name"] == "foo"
     assert task["actions"] == ["poetry run foo bar"]
 
 
-@mock.patch("dodo.check_call")
+def test_parallel_format(bake_project):
+    project = bake_project()
+    with inside_dir(project):
+        importlib.reload(dodo)
+        assert dodo.DOIT_CONFIG["num_process"] >= 1
+        black, isort = dodo.task_format()
+        assert "format:black" not in black["task_dep"]
+        assert "format:black" in isort["task_dep"]
+    importlib.reload(dodo)
+
+
+RACE_DODO = """
+from dodo import DOIT_CONFIG  # noqa
+
+
+def shout(word):
+    for __ in range(500):
+        print(word)
+        time.sleep(0.001)
+    return False
+
+
+def task_race():
+    for word in ("foo", "bar"):
+        yield {"name": word, "actions": [(shout, (word,))], "verbosity": 0}
+"""
+
+
+def test_parallel_python_actions(bake_copy):
+    project = bake_copy()
+    project.join("dodo_race.py").write("import time\n" + RACE_DODO)
+    with inside_dir(project):
+        cmd = ["doit", "-n", "2", "--continue", "-f", "dodo_race.py", "race"]
+        out = subprocess.run(cmd, stdout=PIPE, universal_newlines=True).stdout
+    for word in ("foo", "bar"):
+        captured = out.split("race:{} <stdout>:\n".format(word))[1]
+        assert captured.split("\n")[:501] == [word] * 500 + [""]
+
+
+def test_test_all_subtasks(bake_project):
+    project = bake_project()
+    with inside_dir(project):
+        importlib.reload(dodo)
+        subtasks = list(dodo.task_test_all())
+        assert [task["name"] for task in subtasks] == dodo.get_tox_envs()
+        assert "py37" in dodo.get_tox_envs()
+        assert "poetry run tox -e py27" in subtasks[0]["actions"]
+    importlib.reload(dodo)
+
+
+def test_env_cache(bake_copy, tmpdir):
+    project = bake_copy({"project_name": "mypackage"})
+    with inside_dir(project):
+        importlib.reload(dodo)
+        dodo.ENV_CACHE = str(tmpdir.join("cache"))
+        project.join("poetry.lock").write("foo")
+        pythons = []
+        for venv in ("venv1", "venv2"):
+            venv = str(tmpdir.join(venv))
+            subprocess.check_call(
+                [sys.executable, "-m", "venv", "--without-pip", venv]
+            )
+            pythons.append(os.path.join(venv, "bin", "python"))
+        __, site_packages, scripts = dodo.get_python_paths(pythons[0])
+        os.mkdir(os.path.join(site_packages, "foo"))
+        for name in ("foo/__init__.py", "mypackage.pth"):
+            with open(os.path.join(site_packages, name), "w") as fo:
+                fo.write("")
+        with open(os.path.join(scripts, "foo"), "w") as fo:
+            fo.write("#!{}\nimport foo\n".format(pythons[0]))
+        dodo.save_env(pythons[0])
+        assert len(tmpdir.join("cache").listdir()) == 1
+        dodo.hydrate_env(pythons[1])
+        __, site_packages, scripts = dodo.get_python_paths(pythons[1])
+        package = os.path.join(site_packages, "foo", "__init__.py")
+        assert os.stat(package).st_nlink == 3
+        assert not os.path.exists(os.path.join(site_packages, "mypackage.pth"))
+        with open(os.path.join(scripts, "foo")) as fo:
+            assert fo.read() == "#!{}\nimport foo\n".format(pythons[1])
+        assert os.path.exists(os.path.join(site_packages, dodo.ENV_KEY_FILE))
+    importlib.reload(dodo)
+
+
+def test_env_cache_installed(bake_copy, tmpdir):
+    project = bake_copy({"project_name": "mypackage"})
+    with inside_dir(project):
+        importlib.reload(dodo)
+        dodo.ENV_CACHE = str(tmpdir.join("cache"))
+        project.join("poetry.lock").write("foo")
+        venv = str(tmpdir.join("venv"))
+        subprocess.check_call(
+            [sys.executable, "-m", "venv", "--without-pip", venv]
+        )
+        python = os.path.join(venv, "bin", "python")
+        version, site_packages, __ = dodo.get_python_paths(python)
+        cached = tmpdir.join("cache", dodo.get_env_key(version))
+        cached.ensure("site-packages", "foo-2.0.dist-info", "RECORD")
+        cached.ensure("site-packages", "foo", "__init__.py")
+        cached.ensure("scripts", dir=True)
+        # Installed with other poetry.lock
+        for name in ("foo-1.0.dist-info", "mypackage-0.1.0.dist-info"):
+            os.mkdir(os.path.join(site_packages, name))
+        assert dodo.get_installed_packages(site_packages) == [
+            "foo-1.0.dist-info"
+        ]
+        dodo.hydrate_env(python)
+        assert not os.path.exists(os.path.join(site_packages, "foo"))
+        assert not os.path.exists(
+            os.path.join(site_packages, "foo-2.0.dist-info")
+        )
+        os.rmdir(os.path.join(site_packages, "foo-1.0.dist-info"))
+        with open(os.path.join(site_packages, dodo.ENV_KEY_FILE), "w") as fo:
+            fo.write("other")
+        dodo.hydrate_env(python)
+        assert not os.path.exists(os.path.join(site_packages, "foo"))
+    importlib.reload(dodo)
+
+
+def test_check_coverage_combined(bake_copy):
+    project = bake_copy()
+    with inside_dir(project):
+        importlib.reload(dodo)
+        task = mock.MagicMock(value_savers=[])
+        project.join(".coverage.test").write("foo")
+        assert not dodo.check_coverage_combined(task, {})
+        values = task.value_savers[0]()
+        assert dodo.check_coverage_combined(task, values)
+        project.join(".coverage.py37").write("bar")
+        assert not dodo.check_coverage_combined(task, values)
+    importlib.reload(dodo)
+
+
+def test_get_current_coverage_data(bake_copy):
+    project = bake_copy()
+    with inside_dir(project):
+        importlib.reload(dodo)
+        assert dodo.get_current_coverage_data(["tox.ini"]) == []
+        project.join(".coverage.py37.a1").write("")
+        dodo.save_coverage_key(".coverage.py37", ["tox.ini"])
+        project.join("tox.ini").write("\n", mode="a")
+        project.join(".coverage.test.b1").write("")
+        project.join(".coverage.test.b2").write("")
+        dodo.save_coverage_key(".coverage.test", ["tox.ini"])
+        assert dodo.get_current_coverage_data(["tox.ini"]) == [
+            ".coverage.test.b1",
+            ".coverage.test.b2",
+        ]
+    importlib.reload(dodo)
+
+
+def test_get_changed_lines():
+    old = ["a", "b", "c", "d"]
+    assert dodo.get_changed_lines(old, old) == set()
+    assert dodo.get_changed_lines(old, ["a", "x", "c", "d"]) == {2}
+    assert dodo.get_changed_lines(old, ["a", "b", "d"]) == {3}
+    assert dodo.get_changed_lines(old, ["a", "b", "x", "c", "d"]) == {2, 3}
+
+
+def test_read_test_contexts(bake_project, tmpdir):
+    project = bake_project()
+    with inside_dir(project):
+        importlib.reload(dodo)
+    for name, context, lines in [
+        ("data.1", "tests/test_a.py::test_a|run", [1, 2]),
+        ("data.2", "", [1, 3]),
+    ]:
+        data = coverage.CoverageData(str(tmpdir.join(name)))
+        data.set_context(context)
+        data.add_lines({str(tmpdir.join("a.py")): lines})
+        data.write()
+
+    def venv_stdout(cmd):
+        cmd = [sys.executable] + cmd[3:]
+        return subprocess.check_output(cmd, universal_newlines=True)
+
+    with mock.patch("dodo.get_stdout", side_effect=venv_stdout):
+        contexts = dodo.read_test_contexts(str(tmpdir.join("data.*")))
+        assert dodo.read_test_contexts(str(tmpdir.join("foo.*"))) == {}
+    assert contexts == {
+        os.path.relpath(str(tmpdir.join("a.py"))): {
+            "tests/test_a.py::test_a": {1, 2},
+            "": {1, 3},
+        }
+    }
+    importlib.reload(dodo)
+
+
+def test_get_affected_tests(bake_copy):
+    project = bake_copy({"project_name": "mypackage"})
+    with inside_dir(project):
+        importlib.reload(dodo)
+        files = ["tox.ini", "mypackage/cli.py", "tests/test_cli.py"]
+        impact = {
+            "files": {path_: dodo.get_line_hashes(path_) for path_ in files},
+            "tests": {
+                "mypackage/cli.py": {
+                    "": {1, 2, 3},
+                    "tests/test_cli.py::test_a": {23},
+                    "tests/test_cli.py::test_b": {22, 24},
+                }
+            },
+        }
+        assert dodo.get_affected_tests(None, files) is None
+        assert dodo.get_affected_tests(impact, files) == set()
+        lines = project.join("mypackage", "cli.py").readlines()
+        lines[22] = "    pass\n"
+        project.join("mypackage", "cli.py").write("".join(lines))
+        affected = dodo.get_affected_tests(impact, files)
+        assert affected == {"tests/test_cli.py::test_a"}
+        lines[0] = "# Comment\n"
+        project.join("mypackage", "cli.py").write("".join(lines))
+        affected = dodo.get_affected_tests(impact, files)
+        assert affected == {
+            "tests/test_cli.py::test_a",
+            "tests/test_cli.py::test_b",
+        }
+        project.join("tests", "test_cli.py").write("\n", mode="a")
+        affected = dodo.get_affected_tests(impact, files)
+        assert affected == {"tests/test_cli.py"}
+        project.join("tests", "utils.py").write("")
+        files.append("tests/utils.py")
+        assert dodo.get_affected_tests(impact, files) is None
+        files.pop()
+        project.join("tox.ini").write("\n", mode="a")
+        assert dodo.get_affected_tests(impact, files) is None
+    importlib.reload(dodo)
+
+
+def test_get_critical_path():
+    entries = {
+        "a": {"wall": 1.0, "task_dep": []},
+        "b": {"wall": 2.0, "task_dep": ["a"]},
+        "c": {"wall": 0.5, "task_dep": []},
+        "d": {"wall": 1.0, "task_dep": ["b", "c", "e"]},
+    }
+    assert dodo.get_critical_path(entries) == (4.0, ["a", "b", "d"])
+    assert dodo.get_critical_path({}) == (0.0, [])
+
+
+def test_timing_reporter(bake_copy, capsys):
+    project = bake_copy()
+    with inside_dir(project):
+        importlib.reload(dodo)
+        for __ in range(2):
+            cmd = ["doit", "-n", "0", "_python_files", "_docs_files"]
+            assert subprocess.run(cmd).returncode == 0
+        runs = dodo.read_timing_log(5)
+        assert len(runs) == 2
+        entry = runs[-1]["_python_files"]
+        assert entry["status"] == "success"
+        assert set(entry) >= {"wall", "cpu", "rss", "task_dep"}
+        assert entry["cpu"] is not None
+        dodo.show_profile(1)
+        out = capsys.readouterr().out
+        assert "Slowest tasks (mean of the last 1 runs):" in out
+        assert "Critical path of the last run" in out
+    importlib.reload(dodo)
+
+
+@mock.patch("dodo.get_children_usage")
+def test_timing_reporter_overlap(mock_usage, tmpdir):
+    usage = [(1.0, 10), (1.0, 10), (3.0, 20), (4.0, 30), (5.0, 30)]
+    mock_usage.side_effect = usage + [(7.0, 40)]
+    tasks = [mock.MagicMock(task_dep=[]) for __ in range(3)]
+    for name, task in zip("abc", tasks):
+        task.name = name
+    with mock.patch("dodo.TIMING_LOG", str(tmpdir.join("timing"))):
+        reporter = dodo.TimingReporter(mock.MagicMock(), {})
+        reporter.execute_task(tasks[0])
+        reporter.execute_task(tasks[1])
+        reporter.add_success(tasks[0])
+        reporter.add_success(tasks[1])
+        reporter.execute_task(tasks[2])
+        reporter.add_success(tasks[2])
+        log = [json.loads(line) for line in tmpdir.join("timing").open()]
+    assert [(e["task"], e["cpu"], e["rss"]) for e in log] == [
+        ("a", None, None),
+        ("b", None, None),
+        ("c", 2.0, 40),
+    ]
+
+
 @mock.patch("dodo.check_output")
-def test_checkout_ok(mock_co, mock_cc):
-    mock_co.return_value = "foo"
-    with dodo.checkout("bar"):
-        mock_cc.assert_called_once_with(["git", "checkout", "bar"])
-    mock_cc.assert_called_with(["git", "checkout", "foo"])
+def test_get_git_status(mock_co):
+    dodo.get_git_status.cache_clear()
+    mock_co.return_value = "# branch.oid 1a2b\n# branch.head foo\n"
+    assert dodo.get_git_status() == ("foo", True)
+    assert dodo.get_git_status() == ("foo", True)
+    mock_co.assert_called_once_with(
+        dodo.GIT_STATUS_CMD, universal_newlines=True
+    )
+    dodo.get_git_status.cache_clear()
+    mock_co.return_value += "1 .M N... 100644 100644 100644 1a 2b dodo.py\n"
+    assert dodo.get_git_status() == ("foo", False)
+    dodo.get_git_status.cache_clear()
 
 
-@mock.patch("dodo.check_call")
 @mock.patch("dodo.check_output")
-def test_checkout_return(mock_co, mock_cc):
-    def dummy():
-        mock_co.return_value = "foo"
-        with dodo.checkout("bar"):
-            mock_cc.assert_called_once_with(["git", "checkout", "bar"])
-            return "taz"
+def test_get_last_version(mock_co):
+    mock_co.return_value = "v0.1.0-rc1-3-g1a2b3c4\n"
+    assert dodo.get_last_version("master") == ("v0.1.0-rc1", 3)
+    mock_co.assert_called_once_with(
+        dodo.GIT_LAST_VERSION_CMD + ["master"], universal_newlines=True
+    )
+
+
+@mock.patch("dodo.get_stdout")
+def test_get_worktree_path(mock_gs):
+    mock_gs.return_value = (
+        "worktree /foo\nHEAD 1a2b\nbranch refs/heads/master\n\n"
+        "worktree /bar\nHEAD 3c4d\nbranch refs/heads/develop\n\n"
+    )
+    assert dodo.get_worktree_path("develop") == "/bar"
+    assert dodo.get_worktree_path("master") == "/foo"
+    assert dodo.get_worktree_path("taz") is None
+
+
+@mock.patch("dodo.get_worktree_path", return_value="/foo")
+@mock.patch("dodo.check_call")
+def test_worktree_checked_out(mock_cc, mock_gwp):
+    with dodo.worktree("bar") as path_:
+        assert path_ == "/foo"
+    assert not mock_cc.called
+
 
-    dummy()
-    mock_cc.assert_called_with(["git", "checkout", "foo"])
+@mock.patch("dodo.get_worktree_path", return_value=None)
+@mock.patch("dodo.check_call")
+def test_worktree_ok(mock_cc, mock_gwp):
+    with dodo.worktree("bar") as path_:
+        assert os.path.isdir(os.path.dirname(path_))
+        add_cmd = ["git", "worktree", "add", path_, "bar"]
+        mock_cc.assert_called_once_with(add_cmd)
+    assert not os.path.exists(os.path.dirname(path_))
+    mock_cc.assert_called_with(["git", "worktree", "prune"])
 
 
+@mock.patch("dodo.get_worktree_path", return_value=None)
 @mock.patch("dodo.check_call")
-@mock.patch("dodo.check_output")
-def test_checkout_raises(mock_co, mock_cc):
-    mock_co.return_value = "foo"
+def test_worktree_raises(mock_cc, mock_gwp):
     with pytest.raises(Exception):
-        with dodo.checkout("bar"):
-            mock_cc.assert_called_once_with(["git", "checkout", "bar"])
+        with dodo.worktree("bar") as path_:
             raise Exception
-    mock_cc.assert_called_with(["git", "checkout", "foo"])
+    assert not os.path.exists(os.path.dirname(path_))
+    mock_cc.assert_called_with(["git", "worktree", "prune"])
+
+
+def test_is_worktree_clean(tmpdir):
+    git = ["git", "-c", "user.name=foo", "-c", "user.email=foo@bar"]
+    with inside_dir(tmpdir.mkdir("repo")):
+        subprocess.check_call(["git", "init", "-q", "-b", "master"])
+        subprocess.check_call(
+            git + ["commit", "-q", "--allow-empty", "-m", "foo"]
+        )
+        subprocess.check_call(["git", "branch", "develop"])
+        assert dodo.is_worktree_clean("develop")
+        develop = str(tmpdir.join("develop"))
+        subprocess.check_call(
+            ["git", "worktree", "add", "-q", develop, "develop"]
+        )
+        assert dodo.is_worktree_clean("develop")
+        tmpdir.join("develop", "foo").write("foo")
+        assert not dodo.is_worktree_clean("develop")
+        assert dodo.is_worktree_clean("master")
+
+
+def test_do_merge_in_worktree(tmpdir):
+    git = ["git", "-c", "user.name=foo", "-c", "user.email=foo@bar"]
+
+    def git_without_push(cmd, **kwargs):
+        if cmd[1] == "merge":
+            cmd = git + cmd[1:]
+        if cmd[1] != "push":
+            subprocess.check_call(cmd, **kwargs)
+
+    with inside_dir(tmpdir):
+        subprocess.check_call(["git", "init", "-q", "-b", "master"])
+        tmpdir.join("foo").write("foo")
+        subprocess.check_call(["git", "add", "foo"])
+        subprocess.check_call(git + ["commit", "-qm", "foo"])
+        subprocess.check_call(["git", "checkout", "-qb", "develop"])
+        tmpdir.join("bar").write("bar")
+        subprocess.check_call(["git", "add", "bar"])
+        subprocess.check_call(git + ["commit", "-qm", "bar"])
+        dodo.get_git_status.cache_clear()
+        with mock.patch("dodo.check_call") as mock_cc:
+            mock_cc.side_effect = git_without_push
+            dodo.do_merge(mock.MagicMock(error=None), [])
+            push = mock_cc.call_args_list[-2]
+            assert push[0][0] == ["git", "push", "origin", "master"]
+        dodo.get_git_status.cache_clear()
+        assert dodo.get_git_status() == ("develop", True)
+        assert dodo.get_stdout(["git", "show", "master:bar"]) == "bar"
+    dodo.get_git_status.cache_clear()
+
+
+def test_do_merge_conflict(tmpdir):
+    git = ["git", "-c", "user.name=foo", "-c", "user.email=foo@bar"]
+    with inside_dir(tmpdir):
+        subprocess.check_call(["git", "init", "-q", "-b", "master"])
+        tmpdir.join("foo").write("foo")
+        subprocess.check_call(["git", "add", "foo"])
+        subprocess.check_call(git + ["commit", "-qm", "foo"])
+        subprocess.check_call(["git", "checkout", "-qb", "develop"])
+        tmpdir.join("foo").write("bar")
+        subprocess.check_call(git + ["commit", "-qam", "bar"])
+        subprocess.check_call(["git", "checkout", "-q", "master"])
+        tmpdir.join("foo").write("taz")
+        subprocess.check_call(git + ["commit", "-qam", "taz"])
+        subprocess.check_call(["git", "checkout", "-q", "develop"])
+        dodo.get_git_status.cache_clear()
+        with mock.patch("dodo.check_call") as mock_cc:
+            mock_cc.side_effect = lambda cmd, **kwargs: subprocess.check_call(
+                git + cmd[1:], **kwargs
+            )
+            result = dodo.do_merge(mock.MagicMock(error=None), [])
+        assert isinstance(result, TaskFailed)
+        assert "git merge master" in str(result)
+        assert dodo.get_stdout(["git", "show", "master:foo"]) == "taz"
+        dodo.get_git_status.cache_clear()
+        assert dodo.get_git_status() == ("develop", True)
+    dodo.get_git_status.cache_clear()
 
 
 @pytest.mark.parametrize("command", ["format", "style", "test"])
-def test_doit_command_run_in_project(cookies, command):
-    result = cookies.bake()
-    with inside_dir(result.project):
+def test_doit_command_run_in_project(bake_copy, command):
+    project = bake_copy()
+    with inside_dir(project):
         with poetryenv_in_project():
             assert subprocess.run(["doit", command]).returncode == 0
 
@@ -118,9 +714,8 @@ def bad_style_code():
 
 @pytest.mark.parametrize("pkg_name", ["mypackage", "tests"])
 @pytest.mark.parametrize("expected_error", list(bad_style_code().keys()))
-def test_doit_style_with_fails(cookies, capfd, pkg_name, expected_error):
-    result = cookies.bake(extra_context={"project_name": "mypackage"})
-    project = result.project
+def test_doit_style_with_fails(bake_copy, capfd, pkg_name, expected_error):
+    project = bake_copy({"project_name": "mypackage"})
     with inside_dir(project):
         with project.join(pkg_name, "dummy.py").open("w") as fo:
             fo.write(bad_style_code()[expected_error])
@@ -130,21 +725,20 @@ def test_doit_style_with_fails(cookies, capfd, pkg_name, expected_error):
         assert expected_error in captured.out
 
 
-def test_doit_coverage(cookies):
-    result = cookies.bake()
-    with inside_dir(result.project):
+def test_doit_coverage(bake_copy):
+    project = bake_copy()
+    with inside_dir(project):
         with poetryenv_in_project():
             importlib.reload(dodo)
             dodo.webbrowser = mock.MagicMock()
+            assert DoitMain(ModuleTaskLoader(dodo)).run(["test"]) == 0
             assert DoitMain(ModuleTaskLoader(dodo)).run(["coverage"]) == 0
     importlib.reload(dodo)
 
 
 @pytest.mark.parametrize("docs_generator", ["Sphinx", "MkDocs"])
-def test_doit_docs(cookies, docs_generator):
-    extra_context = {"docs_generator": docs_generator}
-    result = cookies.bake(extra_context=extra_context)
-    project = result.project
+def test_doit_docs(bake_copy, docs_generator):
+    project = bake_copy({"docs_generator": docs_generator})
     with inside_dir(project):
         with poetryenv_in_project():
             importlib.reload(dodo)
@@ -157,9 +751,9 @@ def test_doit_docs(cookies, docs_generator):
     importlib.reload(dodo)
 
 
-def test_bumpversion(cookies):
-    result = cookies.bake()
-    with inside_dir(result.project):
+def test_bumpversion(bake_copy):
+    project = bake_copy()
+    with inside_dir(project):
         with poetryenv_in_project():
             subprocess.run(["poetry", "install"])
             bump = subprocess.run(
@@ -179,9 +773,9 @@ def test_bumpversion(cookies):
             )
 
 
-def test_entrypoints(cookies, capfd):
-    result = cookies.bake()
-    with inside_dir(result.project):
+def test_entrypoints(bake_copy, capfd):
+    project = bake_copy()
+    with inside_dir(project):
         with poetryenv_in_project():
             assert subprocess.run(["doit", "install"]).returncode == 0
             emoji_cmd = ["poetry", "run", "emoji", "-e", "snek", "-c", "3"]
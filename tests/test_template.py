@@ -1,8 +1,13 @@
 import datetime
+import filecmp
 import json
+import os
+import subprocess
+import sys
 
 import pytest
 
+import bake
 from tests.utils import inside_dir
 
 
@@ -16,11 +21,8 @@ def cookiecutter():
         return vars_
 
 
-def test_with_defaults(cookies, cookiecutter):
-    result = cookies.bake()
-    project = result.project
-    assert result.exit_code == 0, "Exit code ok"
-    assert result.exception is None, "Render without errors"
+def test_with_defaults(bake_project, cookiecutter):
+    project = bake_project()
     assert project.isdir(), "Project directory exists"
     assert project.join(cookiecutter["project_slug"]).check(dir=1)
     assert project.join(
@@ -40,11 +42,12 @@ def test_with_defaults(cookies, cookiecutter):
     assert project.join(".travis.yml").check(file=1)
     assert not project.join("sphinx").check()
     assert not project.join("bin", "serve-docs").check()
+    assert not project.join("bin", "docs_helpers.py").check()
 
 
-def test_slug(cookies):
-    result = cookies.bake(extra_context={"project_name": "Foo Bar-Taz"})
-    assert result.project.basename == "foo_bar_taz", "Test project slug"
+def test_slug(bake_project):
+    project = bake_project({"project_name": "Foo Bar-Taz"})
+    assert project.basename == "foo_bar_taz", "Test project slug"
 
 
 def license_strings():
@@ -59,9 +62,8 @@ def license_strings():
 @pytest.mark.parametrize(
     "license, target_string", list(license_strings().items())
 )
-def test_selecting_license(cookies, cookiecutter, license, target_string):
-    result = cookies.bake(extra_context={"license": license})
-    project = result.project
+def test_selecting_license(bake_project, cookiecutter, license, target_string):
+    project = bake_project({"license": license})
     with inside_dir(project):
         license_text = project.join("LICENSE").read()
         assert target_string in license_text
@@ -71,18 +73,16 @@ def test_selecting_license(cookies, cookiecutter, license, target_string):
         assert license in project.join("pyproject.toml").read()
 
 
-def test_not_open_source_license(cookies):
-    result = cookies.bake(extra_context={"license": "Not open source"})
-    project = result.project
+def test_not_open_source_license(bake_project):
+    project = bake_project({"license": "Not open source"})
     with inside_dir(project):
         assert not project.join("LICENSE").check()
 
 
-def test_not_command_line_interface(cookies, cookiecutter):
-    result = cookies.bake(
-        extra_context={"command_line_interface": "No command-line interface"}
+def test_not_command_line_interface(bake_project, cookiecutter):
+    project = bake_project(
+        {"command_line_interface": "No command-line interface"}
     )
-    project = result.project
     with inside_dir(project):
         assert not project.join(cookiecutter["project_slug"], "cli.py").check()
         assert not project.join(
@@ -90,25 +90,23 @@ def test_not_command_line_interface(cookies, cookiecutter):
         ).check()
 
 
-def test_circleci(cookies, cookiecutter):
-    result = cookies.bake(extra_context={"continous_integration": "CircleCI"})
-    project = result.project
+def test_circleci(bake_project, cookiecutter):
+    project = bake_project({"continous_integration": "CircleCI"})
     with inside_dir(project):
         assert project.join(".circleci", "config.yml").check(file=1)
 
 
-def test_no_ci(cookies, cookiecutter):
-    result = cookies.bake(extra_context={"continous_integration": "No CI"})
-    project = result.project
+def test_no_ci(bake_project, cookiecutter):
+    project = bake_project({"continous_integration": "No CI"})
     with inside_dir(project):
         assert not project.join(".travis.yml").check()
         assert not project.join(".circleci").check()
 
 
-def test_pyproject(cookies, cookiecutter):
-    result = cookies.bake()
-    with inside_dir(result.project):
-        pyproject = result.project.join("pyproject.toml").read()
+def test_pyproject(bake_project, cookiecutter):
+    project = bake_project()
+    with inside_dir(project):
+        pyproject = project.join("pyproject.toml").read()
         assert cookiecutter["project_slug"] in pyproject
         assert cookiecutter["version"] in pyproject
         assert cookiecutter["project_short_description"] in pyproject
@@ -116,9 +114,94 @@ def test_pyproject(cookies, cookiecutter):
         assert cookiecutter["email"] in pyproject
 
 
-def test_selecting_sphinx(cookies):
-    result = cookies.bake(extra_context={"docs_generator": "Sphinx"})
-    project = result.project
+def test_selecting_sphinx(bake_project):
+    project = bake_project({"docs_generator": "Sphinx"})
     assert project.join("docs", "index.rst").check(file=1)
     assert project.join("bin", "serve-docs").check(file=1)
+    assert project.join("bin", "docs_helpers.py").check(file=1)
     assert not project.join("mkdocs.yml").check()
+
+
+def get_tree(top):
+    tree = []
+    for dirpath, __, filenames in os.walk(top):
+        tree.extend(
+            os.path.relpath(os.path.join(dirpath, filename), top)
+            for filename in filenames
+        )
+    return sorted(tree)
+
+
+@pytest.mark.parametrize(
+    "extra_context",
+    [
+        {},
+        {"project_name": "Foo Bar-Taz"},
+        {"license": "BSD-4-Clause"},
+        {"license": "Apache-2.0"},
+        {"license": "GPL-3.0"},
+        {"license": "Not open source"},
+        {"docs_generator": "Sphinx"},
+        {"command_line_interface": "No command-line interface"},
+        {"continous_integration": "CircleCI"},
+        {"continous_integration": "No CI"},
+        {
+            "docs_generator": "Sphinx",
+            "command_line_interface": "No command-line interface",
+            "continous_integration": "CircleCI",
+        },
+    ],
+)
+def test_bake(cookies, tmpdir, extra_context):
+    result = cookies.bake(extra_context=extra_context)
+    assert result.exit_code == 0, "Exit code ok"
+    assert result.exception is None, "Render without errors"
+    project = bake.bake(extra_context, output_dir=str(tmpdir))
+    tree = get_tree(project)
+    assert tree == get_tree(str(result.project))
+    __, mismatch, errors = filecmp.cmpfiles(
+        project, str(result.project), tree, shallow=False
+    )
+    assert mismatch == errors == []
+
+
+def test_bake_invalid_slug(tmpdir):
+    with pytest.raises(bake.FailedHookException):
+        bake.bake({"project_slug": "foo-bar"}, output_dir=str(tmpdir))
+
+
+def test_bake_output_exists(tmpdir):
+    bake.bake(output_dir=str(tmpdir))
+    with pytest.raises(bake.OutputDirExistsException):
+        bake.bake(output_dir=str(tmpdir))
+
+
+def test_duration_budget(bake_copy):
+    project = bake_copy()
+    project.join("tests", "test_slow.py").write(
+        "import time\n\n"
+        "import pytest\n\n\n"
+        "def test_slow():\n"
+        "    time.sleep(0.4)\n\n\n"
+        "@pytest.mark.duration_budget(2)\n"
+        "def test_slow_allowed():\n"
+        "    time.sleep(0.3)\n"
+    )
+    pytest_cmd = [sys.executable, "-m", "pytest", "-o", "addopts=", "-p"]
+    pytest_cmd += ["no:xdist", "-o", "duration_budget=0.2", "--slowest-first"]
+    with inside_dir(project):
+        result = subprocess.run(
+            pytest_cmd, stdout=subprocess.PIPE, universal_newlines=True
+        )
+        assert result.returncode == 1
+        assert "1 failed, " in result.stdout
+        assert "over its duration budget of 0.200s" in result.stdout
+        report = project.join("docs", "slowtests.txt").readlines()
+        assert report[0] == "Slowest tests (duration budget 0.200s)\n"
+        assert report[2].endswith("tests/test_slow.py::test_slow\n")
+        result = subprocess.run(
+            pytest_cmd + ["--collect-only", "-q"],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        assert result.stdout.startswith("tests/test_slow.py::test_slow")
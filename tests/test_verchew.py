@@ -0,0 +1,90 @@
+import os
+import time
+from collections import OrderedDict
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+
+import mock
+import pytest
+
+loader = SourceFileLoader("verchew", os.path.join("bin", "verchew"))
+verchew = module_from_spec(spec_from_loader("verchew", loader))
+loader.exec_module(verchew)
+
+
+def sleep_config(*seconds):
+    return OrderedDict(
+        (str(i), {"cli": "sleep", "cli_version_arg": str(second)})
+        for i, second in enumerate(seconds)
+    )
+
+
+def test_get_versions_concurrently():
+    start = time.time()
+    outputs = verchew.get_versions(sleep_config(1, 1, 1))
+    assert time.time() - start < 2
+    assert list(outputs.keys()) == ["0", "1", "2"]
+
+
+def test_get_versions_timeout():
+    cache = {}
+    outputs = verchew.get_versions(sleep_config(0, 5), 0.5, cache)
+    assert outputs["0"] == ""
+    assert outputs["1"] == "sh: command timed out: sleep"
+    assert list(cache.values()) == [""]
+
+
+def test_get_versions_cache(tmpdir):
+    cache = {}
+    config = sleep_config(0)
+    verchew.get_versions(config, cache=cache)
+    path = str(tmpdir.join("cache.json"))
+    verchew.save_cache(cache, path)
+    cache = verchew.load_cache(path)
+    with mock.patch.object(verchew, "call") as m_call:
+        assert verchew.get_versions(config, cache=cache) == {"0": ""}
+        assert not m_call.called
+        config["0"]["cli_version_arg"] = "0.0"
+        m_call.return_value = "foo"
+        assert verchew.get_versions(config, cache=cache) == {"0": "foo"}
+    assert len(cache) == 2
+
+
+def test_save_cache(tmpdir):
+    program = tmpdir.mkdir("bin").join("foo")
+    program.write("")
+    program.chmod(0o755)
+    key = verchew.get_cache_key("foo", [str(program), "--version"])
+    path = str(tmpdir.mkdir("cache").join("cache.json"))
+    verchew.save_cache({key: "foo 1.0"}, path)
+    assert verchew.load_cache(path) == {key: "foo 1.0"}
+    program.remove()
+    verchew.save_cache({key: "foo 1.0"}, path)
+    assert verchew.load_cache(path) == {}
+    assert [item.basename for item in tmpdir.join("cache").listdir()] == [
+        "cache.json"
+    ]
+
+
+def test_get_cache_key_shim(tmpdir):
+    for directory in ("bin", "shims"):
+        program = tmpdir.mkdir(directory).join("foo")
+        program.write("")
+        program.chmod(0o755)
+    args = [str(tmpdir.join("bin", "foo")), "--version"]
+    assert verchew.get_cache_key("foo", args) is not None
+    args[0] = str(tmpdir.join("shims", "foo"))
+    assert verchew.get_cache_key("foo", args) is None
+
+
+def test_which():
+    assert os.path.isabs(verchew.which("sleep"))
+    assert verchew.which("not-a-program-name") is None
+
+
+@pytest.mark.parametrize(
+    "argument, expected",
+    [(None, ["foo", "--version"]), ("-V", ["foo", "-V"]), ("", ["foo"])],
+)
+def test_get_args(argument, expected):
+    assert verchew.get_args("foo", argument) == expected
@@ -1,7 +1,6 @@
 """Utilities for tests."""
 
 import os
-import subprocess
 import sys
 from contextlib import contextmanager
 
@@ -25,13 +24,19 @@ def inside_dir(dirpath):
 
 @contextmanager
 def poetryenv_in_project():
-    """Temporarilly set poetry config to make virtualenvs in project."""
-    venvset = "settings.virtualenvs.in-project"
-    old_setting = subprocess.check_output(
-        ["poetry", "config", venvset], universal_newlines=True
-    ).strip("\n\r")
+    """
+    Temporarilly set poetry config to make virtualenvs in project.
+
+    The setting is passed in the environment instead of the global poetry
+    config, so concurrent test processes do not interfere.
+    """
+    venvset = "POETRY_VIRTUALENVS_IN_PROJECT"
+    old_setting = os.environ.get(venvset)
     try:
-        subprocess.run(["poetry", "config", venvset, "true"])
+        os.environ[venvset] = "true"
         yield
     finally:
-        subprocess.run(["poetry", "config", venvset, old_setting])
+        if old_setting is None:
+            del os.environ[venvset]
+        else:
+            os.environ[venvset] = old_setting
@@ -0,0 +1,59 @@
+"""
+Helpers to build the Sphinx documentation.
+
+Shared by dodo.py and bin/serve-docs, that run in different environments,
+so only the standard library is imported.
+"""
+import filecmp
+import os
+import shutil
+import tempfile
+from fnmatch import fnmatch
+
+
+def update_apidoc(package, api_dir, run_apidoc):
+    """
+    Generate the API stubs with sphinx-apidoc writing only the changed ones.
+
+    Unchanged stubs keep their modification time, so Sphinx doesn't read them
+    again. The stubs of removed modules are deleted. run_apidoc is called
+    with the sphinx-apidoc arguments.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        run_apidoc(["-q", "-o", tmp_dir, package])
+        stubs = os.listdir(tmp_dir)
+        for name in stubs:
+            source = os.path.join(tmp_dir, name)
+            target = os.path.join(api_dir, name)
+            if not os.path.isfile(target) or not filecmp.cmp(
+                source, target, shallow=False
+            ):
+                shutil.copyfile(source, target)
+    finally:
+        shutil.rmtree(tmp_dir)
+    for name in os.listdir(api_dir):
+        is_stub = name == "modules.rst" or fnmatch(name, package + "*.rst")
+        if is_stub and name not in stubs:
+            os.remove(os.path.join(api_dir, name))
+
+
+def update_directory(source_dir, target_dir):
+    """
+    Copy source directory into target directory if its index changed.
+
+    Return True if it was copied.
+    """
+    index = os.path.join(source_dir, "index.html")
+    target = os.path.join(target_dir, os.path.basename(source_dir))
+    target_index = os.path.join(target, "index.html")
+    if not os.path.isfile(index) or not os.path.isdir(target_dir):
+        return False
+    if os.path.isfile(target_index) and filecmp.cmp(
+        index, target_index, shallow=False
+    ):
+        return False
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    shutil.copytree(source_dir, target)
+    return True
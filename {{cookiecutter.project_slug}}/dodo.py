@@ -3,48 +3,379 @@
 See: http://pydoit.org/
 Note: Install doit with python3, preferably in a virtual environment
 """
+import configparser
+import difflib
 import glob
+import hashlib
+import json
+import multiprocessing
 import os
+import platform
+import re
 import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import webbrowser
 from contextlib import contextmanager
-from subprocess import check_call, check_output
+from datetime import datetime
+from fnmatch import fnmatch
+from functools import lru_cache
+from statistics import mean
+from subprocess import PIPE, STDOUT, Popen, check_call, check_output, run
 from urllib.request import pathname2url
 
 from doit.exceptions import TaskFailed
+from doit.reporter import ConsoleReporter
+{%- if cookiecutter.docs_generator == "Sphinx" %}
+
+from bin.docs_helpers import update_apidoc, update_directory
+{%- endif %}
+
+try:
+    import resource
+except ImportError:  # Not available in Windows
+    resource = None
 
 DOIT_CONFIG = {
     "default_tasks": ["style", "test"],
     "verbosity": 2,
     "template": "{name:<10} {doc}",
+    # Run independent tasks in parallel, use `doit -n 0` to run serially.
+    # Processes, the python-actions of threads would swap each other stdout
+    "num_process": os.cpu_count() or 1,
+    "par_type": "process",
 }
 LINE_LENGHT = "79"  # black don't have a config file
 
-# Set file_dep to this to run task only when the code changes
-PYTHON_FILES = glob.glob("**/*.py", recursive=True)
-
-# Set file_dep to this to run task only when the documentation changes
-DOCS_FILES = (
-    glob.glob("docs/**/*.md", recursive=True)
-    + glob.glob("docs/**/*.rst", recursive=True)
-    + glob.glob("*.md")
-    + glob.glob("*.rst")
+# Directories never searched for source files. Keep in sync with the
+# [flake8] exclude and [isort] skip_glob options in tox.ini
+EXCLUDE_DIRS = (
+    "venv",
+    ".venv",
+    ".eggs",
+    ".git",
+    ".tox",
+    "build",
+    "dist",
+    "site",
+    "node_modules",
+    "htmlcov",
 )
+# Index of directory modification times to avoid listing unchanged ones
+FILES_INDEX = ".doit.db.files"
+
+# Set calc_dep to this to run task only when the code changes
+PYTHON_FILES = ["_python_files"]
+# Configuration of the tools, the tasks results depends on it
+CONFIG_FILES = ["tox.ini", "pyproject.toml"]
+LINT_BATCH_SIZE = 100
+CACHE_HOME = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "doit"
+)
+# Tasks results shared between branches and worktrees, keyed by its inputs
+RESULT_CACHE = os.path.join(CACHE_HOME, "{{ cookiecutter.project_slug }}")
+# Number of results kept in RESULT_CACHE, the least recently used are removed
+RESULT_CACHE_SIZE = 100
+# Installed dependencies keyed by poetry.lock and Python version. Point it to
+# a prepopulated directory to install offline
+ENV_CACHE = os.environ.get("DOIT_ENV_CACHE", os.path.join(CACHE_HOME, "envs"))
+ENV_KEY_FILE = ".doit-env-key"
+# Packages of a new virtual environment, never cached
+ENV_BASE_PACKAGES = [
+    "__pycache__",
+    "_distutils_hack",
+    "distutils-precedence.pth",
+    "easy_install.py",
+    "pip",
+    "pip-*",
+    "pkg_resources",
+    "setuptools",
+    "setuptools-*",
+    "wheel",
+    "wheel-*",
+]
+
+# Set calc_dep to this to run task only when the documentation changes
+DOCS_FILES = ["_docs_files"]
+# Set calc_dep to this to run task only when the distributed files change
+PACKAGE_FILES = ["_package_files"]
+PACKAGE_DIR = "{{ cookiecutter.project_slug }}"
+# Files out of PACKAGE_DIR included in the distributions
+PACKAGE_EXTRA_FILES = ["pyproject.toml", "README.md", "LICENSE"]
+DIST_DIR = "dist"
+# Fixed timestamp of the files in the distributions (1980-01-01, the minimum
+# in a zip file), so the same sources always give the same artifacts with the
+# same poetry version, that is not pinned nor part of the build cache key
+BUILD_EPOCH = "315532800"
 
 BLACK_CMD = (
     "black -l "
     + LINE_LENGHT
-    + r' {diff} --exclude "(\.venv|\.git|\{{ '{{' }}|\.tox|build|dist)" .'
+    + ' {diff} --exclude "/('
+    + "|".join(re.escape(dir_) for dir_ in EXCLUDE_DIRS)
+    + ')/" .'
 )
+# Combined coverage data. With parallel = True in tox.ini every run writes
+# a data file with this prefix and a suffix, these are merged into this one
+COV_DATA = ".coverage"
+# Data file prefix of doit test, the tox environments use their names
+COV_TEST_DATA = ".coverage.test"
+# Hash of the sources measured in the data files of each prefix
+COV_KEYS = ".doit.db.coverage"
 COV_HTML = os.path.join("docs", "htmlcov")
 COV_INDEX = os.path.join(COV_HTML, "index.html")
+SLOW_TESTS = os.path.join("docs", "slowtests.txt")
+PYTEST_CMD = "poetry run pytest --cov --cov-config=tox.ini --cov-context=test"
+# Lines run by each test, to select the tests affected by a change
+TEST_IMPACT = ".doit.db.impact"
+# Coverage data prefix of the test-affected runs, kept apart from COV_DATA
+TEST_IMPACT_DATA = ".doit.db.impact.coverage"
+# Print the lines of each context in the coverage data files of argv
+READ_CONTEXTS_CODE = """
+import json, sys
+from coverage import CoverageData
+contexts = {}
+for data_file in sys.argv[1:]:
+    data = CoverageData(data_file)
+    data.read()
+    for path_ in data.measured_files():
+        lines = contexts.setdefault(path_, {})
+        for line, names in data.contexts_by_lineno(path_).items():
+            for name in names:
+                lines.setdefault(name, []).append(line)
+print(json.dumps(contexts))
+"""
 DOCS_HTML = "site"
 DOCS_INDEX = os.path.join(DOCS_HTML, "index.html")
+SERVE_DOCS = os.path.join("bin", "serve-docs")
 VERCHEW = os.path.join("bin", "verchew")
-GIT_LAST_VERSION_CMD = ["git", "describe", "--tags", "--abbrev=0"]
+GIT_LAST_VERSION_CMD = ["git", "describe", "--tags", "--long"]
 GIT_BRIEF_LOG_CMD = ["git", "--no-pager", "log", "--oneline"]
-GIT_UNSTAGED_CHANGES = ["git", "status", "--porcelain", "--untracked=no"]
-GIT_CURRENT_BRANCH_CMD = ["git", "rev-parse", "--abbrev-ref", "HEAD"]
+GIT_BRANCHES_CMD = ["git", "for-each-ref", "--format=%(refname:short)"]
+GIT_STATUS_CMD = [
+    "git",
+    "status",
+    "--porcelain=v2",
+    "--branch",
+    "--untracked-files=no",
+]
+
+# Append-only log (JSON lines) with the timing of every executed task
+TIMING_LOG = ".doit.db.timing"
+# Default number of runs summarized by the profile task
+PROFILE_RUNS = 10
+# Modules imported by the importtime task, and their import time budget in
+# seconds. The modules imported at the interpreter startup are not counted
+IMPORT_MODULES = [
+    "{{ cookiecutter.project_slug }}.{{ cookiecutter.project_slug }}",
+{% if cookiecutter.command_line_interface == "Click" %}    "{{ cookiecutter.project_slug }}.cli",
+{% endif %}]
+IMPORT_TIME_BUDGET = 0.2
+# The best of this number of runs is reported
+IMPORT_TIME_RUNS = 3
+
+
+# -------------------- Profiling ------------------------
+
+
+def get_children_usage():
+    """Return CPU time and peak RSS (KiB) of the finished subprocesses."""
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+class TimingReporter(ConsoleReporter):
+    """
+    Console reporter that logs the timing of every executed task.
+
+    Append to TIMING_LOG the wall time of the task, the CPU time of its
+    subprocesses and their peak RSS. The resource usage of the subprocesses
+    is only known for the whole doit process, so the CPU time is not logged
+    for the tasks that overlapped with others or ran in the worker processes
+    of a parallel run. The peak RSS is a high-water
+    mark of all the subprocesses finished so far, it is only logged when the
+    task raised it without overlapping. Use `doit -n 0` to measure every task.
+    """
+
+    def __init__(self, outstream, options):
+        super().__init__(outstream, options)
+        self.run_id = datetime.now().isoformat()
+        self.started = {}
+        self.overlapped = set()
+
+    def execute_task(self, task):
+        if self.started:
+            self.overlapped.update(self.started, [task.name])
+        self.started[task.name] = (time.perf_counter(),) + (
+            get_children_usage()
+        )
+        super().execute_task(task)
+
+    def add_failure(self, task, exception):
+        self.log_task(task, "failure")
+        super().add_failure(task, exception)
+
+    def add_success(self, task):
+        self.log_task(task, "success")
+        super().add_success(task)
+
+    def log_task(self, task, status):
+        """Append the timing of a finished task to TIMING_LOG."""
+        if task.name not in self.started or task.name == "profile":
+            return
+        start, cpu_start, rss_start = self.started.pop(task.name)
+        cpu, rss = get_children_usage()
+        if (
+            cpu is None
+            or task.name in self.overlapped
+            or multiprocessing.active_children()
+        ):
+            cpu = rss = None
+        else:
+            cpu = round(cpu - cpu_start, 3)
+            rss = rss if rss > rss_start else None
+        self.overlapped.discard(task.name)
+        entry = {
+            "run": self.run_id,
+            "task": task.name,
+            "status": status,
+            "wall": round(time.perf_counter() - start, 3),
+            "cpu": cpu,
+            "rss": rss,
+            "task_dep": task.task_dep,
+        }
+        with open(TIMING_LOG, "a") as fo:
+            fo.write(json.dumps(entry) + "\n")
+
+
+DOIT_CONFIG["reporter"] = TimingReporter
+
+
+def read_timing_log(runs):
+    """Return the task entries of the last runs in TIMING_LOG by name."""
+    log = {}
+    try:
+        with open(TIMING_LOG) as fo:
+            for line in fo:
+                entry = json.loads(line)
+                log.setdefault(entry["run"], {})[entry["task"]] = entry
+    except OSError:
+        return []
+    return [log[run_id] for run_id in sorted(log)[-runs:]]
+
+
+def get_critical_path(entries):
+    """Return the duration and tasks of the slowest task_dep chain."""
+    paths = {}
+
+    def visit(name):
+        if name not in paths:
+            duration, path = max(
+                (
+                    visit(dep)
+                    for dep in entries[name]["task_dep"]
+                    if dep in entries
+                ),
+                default=(0.0, []),
+            )
+            paths[name] = (duration + entries[name]["wall"], path + [name])
+        return paths[name]
+
+    return max((visit(name) for name in entries), default=(0.0, []))
+
+
+def show_profile(runs):
+    """Print the slowest tasks, their trends and the critical path."""
+    log = read_timing_log(runs)
+    if not log:
+        print("No timing data in {}, run some tasks first.".format(TIMING_LOG))
+        return
+    tasks = {}
+    for entries in log:
+        for name, entry in entries.items():
+            tasks.setdefault(name, []).append(entry)
+    ranking = sorted(
+        tasks.items(), key=lambda item: -mean(e["wall"] for e in item[1])
+    )
+    print("Slowest tasks (mean of the last {} runs):".format(len(log)))
+    print("  (cpu and rss only of the runs not overlapped by other tasks)")
+    for name, entries in ranking[:10]:
+        cpus = [e["cpu"] for e in entries if e["cpu"] is not None]
+        rsss = [e["rss"] for e in entries if e["rss"] is not None]
+        print(
+            "  {:<24} {:>8.2f}s wall {:>9} cpu {:>9} KiB rss".format(
+                name,
+                mean(entry["wall"] for entry in entries),
+                "{:.2f}s".format(mean(cpus)) if cpus else "-",
+                max(rsss) if rsss else "-",
+            )
+        )
+    print("Trends (wall time of each run, oldest first):")
+    for name, entries in ranking:
+        if len(entries) > 1:
+            walls = " ".join("{:.2f}".format(e["wall"]) for e in entries)
+            print("  {:<24} {}".format(name, walls))
+    duration, path = get_critical_path(log[-1])
+    print("Critical path of the last run ({:.2f}s):".format(duration))
+    print("  " + " -> ".join(path))
+
+
+def parse_importtime(output):
+    """Return the module, self, cumulative and depth of -X importtime lines."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.split(":", 1)[1].split("|")
+        if not fields[0].strip().isdigit():
+            continue  # The header
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append(
+            (name.strip(), int(fields[0]) / 1e6, int(fields[1]) / 1e6, depth)
+        )
+    return entries
+
+
+def check_import_time(modules, budget):
+    """Print the import time of modules and fail if over budget seconds."""
+    cmd = ["poetry", "run", "python", "-X", "importtime", "-c"]
+    startup = run(cmd + ["pass"], stderr=PIPE, universal_newlines=True)
+    startup = {entry[0] for entry in parse_importtime(startup.stderr)}
+    imports = "; ".join("import " + module for module in modules)
+    best = None
+    for __ in range(IMPORT_TIME_RUNS):
+        process = run(cmd + [imports], stderr=PIPE, universal_newlines=True)
+        if process.returncode:
+            return TaskFailed(process.stderr)
+        entries = [
+            entry
+            for entry in parse_importtime(process.stderr)
+            if entry[0] not in startup
+        ]
+        total = sum(entry[2] for entry in entries if entry[3] == 0)
+        if best is None or total < best[0]:
+            best = (total, entries)
+    total, entries = best
+    print("{:>10} {:>10}  {}".format("self", "cumulative", "module"))
+    for name, self_time, cumulative, __ in sorted(
+        entries, key=lambda entry: -entry[2]
+    )[:20]:
+        print(
+            "{:>8.1f}ms {:>8.1f}ms  {}".format(
+                self_time * 1000, cumulative * 1000, name
+            )
+        )
+    msg = "Import time {:.1f}ms, budget {:.1f}ms".format(
+        total * 1000, budget * 1000
+    )
+    print(msg)
+    if total > budget:
+        return TaskFailed(msg)
 
 
 # --------------------- Actions ------------------------
@@ -69,18 +400,111 @@ def clean_paths(*args):
             os.remove(path_)
 
 
-def copy_directory(source_dir, target_dir):
-    """Copy source directory into target directory."""
-    target = os.path.join(target_dir, os.path.basename(source_dir))
-    if (
-        os.path.isdir(source_dir)
-        and os.path.isdir(target_dir)
-        and not os.path.exists(target)
-    ):
-        shutil.copytree(source_dir, target)
+def run_apidoc(argv):
+    """Run sphinx-apidoc with the argv arguments in the project environment."""
+    check_call(["poetry", "run", "sphinx-apidoc"] + argv)
 
 
-def get_subtask(cmd_action, file_dep=None):
+def walk_files(top, index):
+    """
+    Yield the path of every file under top, skipping EXCLUDE_DIRS.
+
+    index maps each directory to its mtime and the names of its files and
+    subdirectories. Only the directories with a different mtime are listed
+    again. The entries of the directories not found are removed.
+    """
+    visited = set()
+    pending = [top]
+    while pending:
+        dirpath = pending.pop()
+        visited.add(dirpath)
+        mtime = os.stat(dirpath).st_mtime_ns
+        entry = index.get(dirpath)
+        if entry is None or entry[0] != mtime:
+            files, dirs = [], []
+            for dir_entry in os.scandir(dirpath):
+                if not dir_entry.is_dir(follow_symlinks=False):
+                    files.append(dir_entry.name)
+                elif not any(fnmatch(dir_entry.name, p) for p in EXCLUDE_DIRS):
+                    dirs.append(dir_entry.name)
+            entry = index[dirpath] = [mtime, files, dirs]
+        for name in entry[1]:
+            yield os.path.normpath(os.path.join(dirpath, name))
+        pending.extend(os.path.join(dirpath, name) for name in entry[2])
+    for dirpath in set(index) - visited:
+        del index[dirpath]
+
+
+def find_files(top, *patterns):
+    """
+    Return the sorted paths of the files under top matching any pattern.
+
+    The directories index is persisted between runs in a FILES_INDEX file of
+    its own for each top, so the calc_deps running in parallel processes don't
+    overwrite the index of each other.
+    """
+    if not os.path.isdir(top):
+        return []
+    top_key = hashlib.md5(os.path.normpath(top).encode()).hexdigest()[:12]
+    index_path = FILES_INDEX + "." + top_key
+    try:
+        with open(index_path) as fo:
+            index = json.load(fo)
+    except (OSError, ValueError):
+        index = {}
+    paths = sorted(
+        path_
+        for path_ in walk_files(top, index)
+        if any(fnmatch(os.path.basename(path_), p) for p in patterns)
+    )
+    fd, tmp_path = tempfile.mkstemp(dir=".")
+    with os.fdopen(fd, "w") as fo:
+        json.dump(index, fo)
+    os.replace(tmp_path, index_path)
+    return paths
+
+
+def find_python_files():
+    """Return the Python files as a calc_dep result."""
+    return {"file_dep": find_files(".", "*.py")}
+
+
+def find_docs_files():
+    """Return the documentation files as a calc_dep result."""
+    root_docs = glob.glob("*.md") + glob.glob("*.rst")
+    return {"file_dep": find_files("docs", "*.md", "*.rst") + root_docs}
+
+
+def find_package_files():
+    """Return the files included in the distributions as a calc_dep result."""
+    package_files = [
+        path_
+        for path_ in find_files(PACKAGE_DIR, "*")
+        if not fnmatch(path_, "*.py[co]")
+    ]
+    extra_files = [
+        path_ for path_ in PACKAGE_EXTRA_FILES if os.path.isfile(path_)
+    ]
+    return {"file_dep": package_files + extra_files}
+
+
+def get_version():
+    """Return the version in pyproject.toml."""
+    with open("pyproject.toml") as fo:
+        return re.search(r'^version = "(.*)"', fo.read(), re.M).group(1)
+
+
+def get_dist_pattern(suffix):
+    """
+    Return the pattern of a distribution file of the current version.
+
+    Read when the task runs, not when dodo.py loads, since a release bumps the
+    version in between.
+    """
+    return os.path.join(DIST_DIR, PACKAGE_DIR + "-" + get_version() + suffix)
+
+
+def get_subtask(cmd_action, file_dep=None, calc_dep=None):
     """Return a dictionary defining a substack for string 'cmd_action'."""
     if cmd_action.startswith("poetry run "):
         name = cmd_action.split(" ")[2]
@@ -89,15 +513,557 @@ def get_subtask(cmd_action, file_dep=None):
     task = {"name": name, "actions": [cmd_action], "task_dep": ["install"]}
     if file_dep is not None:
         task["file_dep"] = file_dep
+    if calc_dep is not None:
+        task["calc_dep"] = calc_dep
     return task
 
 
+def split_lint_output(output, paths):
+    """
+    Return a dictionary with the lines of the linter output for each path.
+
+    A line belongs to the path it starts with (or contains as absolute path)
+    or else to the path of the previous line. Lines before any path are lost.
+    """
+    report = {path_: [] for path_ in paths}
+    current = None
+    for line in output.splitlines():
+        for path_ in paths:
+            if line.startswith(path_ + ":") or os.path.abspath(path_) in line:
+                current = path_
+                break
+        if current is not None:
+            report[current].append(line)
+    return report
+
+
+def get_file_hash(path_):
+    """Return the md5 hex digest of the file content."""
+    file_hash = hashlib.md5()
+    with open(path_, "rb") as fo:
+        for chunk in iter(lambda: fo.read(65536), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def copy_path(source, target):
+    """Copy source file or directory to target."""
+    if os.path.isdir(source):
+        shutil.copytree(source, target)
+    else:
+        shutil.copy2(source, target)
+
+
+def lint_changed(cmd_action, name, skip, dependencies):
+    """
+    Run the linter only for the files changed since its last run.
+
+    The output for every file is kept in a report in RESULT_CACHE together
+    with its content hash, so the output for the unchanged files is reused
+    and the whole project is reported. The files are linted in batches of
+    LINT_BATCH_SIZE. Files matching the skip pattern are not linted.
+    """
+    os.makedirs(RESULT_CACHE, exist_ok=True)
+    report_path = os.path.join(RESULT_CACHE, "lint-{}.json".format(name))
+    config = hashlib.md5(cmd_action.encode())
+    for path_ in CONFIG_FILES:
+        config.update(get_file_hash(path_).encode())
+    try:
+        with open(report_path) as fo:
+            report = json.load(fo)
+    except (OSError, ValueError):
+        report = {}
+    if report.get("config") != config.hexdigest():
+        report = {"config": config.hexdigest(), "files": {}}
+    files = {}
+    for path_ in dependencies:
+        if path_.endswith(".py") and (
+            skip is None or not fnmatch(os.path.basename(path_), skip)
+        ):
+            files[path_] = get_file_hash(path_)
+    pending = [
+        path_
+        for path_, signature in sorted(files.items())
+        if report["files"].get(path_, [None])[0] != signature
+    ]
+    report["files"] = {
+        path_: entry
+        for path_, entry in report["files"].items()
+        if path_ in files and path_ not in pending
+    }
+    error = None
+    while pending:
+        batch, pending = pending[:LINT_BATCH_SIZE], pending[LINT_BATCH_SIZE:]
+        result = run(
+            cmd_action.split() + batch,
+            stdout=PIPE,
+            stderr=STDOUT,
+            universal_newlines=True,
+        )
+        batch_report = split_lint_output(result.stdout, batch)
+        if result.returncode != 0 and not any(batch_report.values()):
+            error = result.stdout
+            continue
+        for path_ in batch:
+            report["files"][path_] = [files[path_], batch_report[path_]]
+    fd, tmp_path = tempfile.mkstemp(dir=RESULT_CACHE)
+    with os.fdopen(fd, "w") as fo:
+        json.dump(report, fo)
+    os.replace(tmp_path, report_path)
+    lines = [
+        line
+        for path_ in sorted(report["files"])
+        for line in report["files"][path_][1]
+    ]
+    if error is not None or lines:
+        print("\n".join(lines + ([error] if error else [])))
+        return TaskFailed("{} found style errors.".format(name))
+
+
+def run_cached(cmd_action, outputs, dependencies, env=None):
+    """
+    Run the command unless its result for the same inputs is cached.
+
+    The result is keyed by the command, the extra environment variables, the
+    Python version of the project environment and the content of the
+    dependencies and is kept in RESULT_CACHE. A cached result is replayed
+    printing its output and restoring the outputs (glob patterns of files or
+    directories) that the command created. Only successful runs are cached.
+    """
+    env = env or {}
+    key = hashlib.sha256(cmd_action.encode())
+    key.update(json.dumps(env, sort_keys=True).encode())
+    key.update(get_venv_version().encode())
+    for path_ in sorted(dependencies):
+        key.update(path_.encode())
+        key.update(get_file_hash(path_).encode())
+    cached = os.path.join(RESULT_CACHE, key.hexdigest())
+    if os.path.isdir(cached):
+        os.utime(cached)  # Recently used, see prune_result_cache
+        with open(os.path.join(cached, "output")) as fo:
+            print(fo.read(), end="")
+        for pattern in outputs:
+            clean_paths(pattern)
+            dirname, basename = os.path.split(pattern)
+            for name in os.listdir(cached):
+                if name != "output" and fnmatch(name, basename):
+                    os.makedirs(dirname or ".", exist_ok=True)
+                    target = os.path.join(dirname, name)
+                    copy_path(os.path.join(cached, name), target)
+        return
+    process = Popen(
+        cmd_action,
+        shell=True,
+        stdout=PIPE,
+        stderr=STDOUT,
+        universal_newlines=True,
+        env=dict(os.environ, **env),
+    )
+    lines = []
+    for line in process.stdout:
+        print(line, end="")
+        lines.append(line)
+    if process.wait() != 0:
+        msg = "Command failed: '{}' returned {}"
+        return TaskFailed(msg.format(cmd_action, process.returncode))
+    os.makedirs(RESULT_CACHE, exist_ok=True)
+    result_dir = tempfile.mkdtemp(dir=RESULT_CACHE)
+    with open(os.path.join(result_dir, "output"), "w") as fo:
+        fo.write("".join(lines))
+    for pattern in outputs:
+        for path_ in glob.glob(pattern):
+            copy_path(path_, os.path.join(result_dir, os.path.basename(path_)))
+    try:
+        os.rename(result_dir, cached)
+    except OSError:  # Cached by other process meanwhile
+        shutil.rmtree(result_dir)
+    prune_result_cache()
+
+
+def prune_result_cache(size=RESULT_CACHE_SIZE):
+    """Remove the least recently used results of RESULT_CACHE over size."""
+    results = [
+        os.path.join(RESULT_CACHE, name)
+        for name in os.listdir(RESULT_CACHE)
+        if os.path.isdir(os.path.join(RESULT_CACHE, name))
+    ]
+    results.sort(key=os.path.getmtime, reverse=True)
+    for path_ in results[size:]:
+        shutil.rmtree(path_, ignore_errors=True)
+
+
+def get_line_hashes(path_):
+    """Return the hashes of the lines of a file or None if it doesn't exist."""
+    try:
+        with open(path_, "rb") as fo:
+            return [hashlib.md5(line).hexdigest()[:12] for line in fo]
+    except OSError:
+        return None
+
+
+def is_test_file(path_):
+    """Return True if the path is a test module."""
+    return fnmatch(os.path.basename(path_), "test_*.py")
+
+
+def read_test_contexts(data_files):
+    """
+    Return the lines run by each test in the coverage data files.
+
+    The result maps each measured path to a dictionary of the test node ids
+    and the set of their lines. The lines run outside any test, like module
+    imports during collection, are keyed by an empty node id. data_files is
+    a glob pattern. The data is read with coverage in the project environment.
+    """
+    paths = glob.glob(data_files)
+    if not paths:
+        return {}
+    cmd = ["poetry", "run", "python", "-c", READ_CONTEXTS_CODE] + paths
+    contexts = {}
+    for path_, lines in json.loads(get_stdout(cmd)).items():
+        tests = contexts.setdefault(os.path.relpath(path_), {})
+        for context, context_lines in lines.items():
+            nodeid = context.rsplit("|", 1)[0]
+            tests.setdefault(nodeid, set()).update(context_lines)
+    return contexts
+
+
+def load_test_impact():
+    """Return the content of TEST_IMPACT or None if it doesn't exist."""
+    try:
+        with open(TEST_IMPACT) as fo:
+            impact = json.load(fo)
+    except (OSError, ValueError):
+        return None
+    for tests in impact["tests"].values():
+        for nodeid, lines in tests.items():
+            tests[nodeid] = set(lines)
+    return impact
+
+
+def save_test_impact(data_files, dependencies, selected=None):
+    """
+    Update TEST_IMPACT with the tests run in the coverage data files.
+
+    If selected is None it was the whole suite, else only these test files
+    and node ids. The line hashes of the dependencies are updated to detect
+    the next changes.
+    """
+    contexts = read_test_contexts(data_files) if data_files else {}
+    impact = load_test_impact() if selected is not None else None
+    if impact is None:
+        impact = {"tests": contexts}
+    else:
+        for tests in impact["tests"].values():
+            for nodeid in list(tests):
+                if nodeid in selected or nodeid.split("::")[0] in selected:
+                    del tests[nodeid]
+        for path_, tests in contexts.items():
+            for nodeid, lines in tests.items():
+                impact["tests"].setdefault(path_, {}).setdefault(
+                    nodeid, set()
+                ).update(lines)
+    impact["files"] = {
+        path_: get_line_hashes(path_) for path_ in sorted(dependencies)
+    }
+    for tests in impact["tests"].values():
+        for nodeid, lines in tests.items():
+            tests[nodeid] = sorted(lines)
+    fd, tmp_path = tempfile.mkstemp(dir=".")
+    with os.fdopen(fd, "w") as fo:
+        json.dump(impact, fo)
+    os.replace(tmp_path, TEST_IMPACT)
+
+
+def get_changed_lines(old, new):
+    """Return the numbers of the lines of old changed in new."""
+    changed = set()
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, __, __ in matcher.get_opcodes():
+        if tag == "insert":  # The lines around the insertion point
+            changed.update([i1, i1 + 1])
+        elif tag != "equal":
+            changed.update(range(i1 + 1, i2 + 1))
+    return changed
+
+
+def get_affected_tests(impact, dependencies):
+    """
+    Return the test files and node ids affected by the changes.
+
+    Return None to run the whole suite when there is no previous data or a
+    configuration or conftest file changed, or a changed file has no test
+    data (not measured by coverage, like test helpers). A changed source line
+    selects the tests that run it. If no test runs it (module level code,
+    comments) all the tests that run any line of the file are selected.
+    """
+    if impact is None:
+        return None
+    selected = set()
+    for path_ in sorted(set(impact["files"]) | set(dependencies)):
+        old = impact["files"].get(path_)
+        new = get_line_hashes(path_)
+        if old == new:
+            continue
+        if path_ in CONFIG_FILES or os.path.basename(path_) == "conftest.py":
+            return None
+        if is_test_file(path_):
+            if new is not None:
+                selected.add(path_)
+            continue
+        file_tests = {
+            nodeid: lines
+            for nodeid, lines in impact["tests"].get(path_, {}).items()
+            if nodeid
+        }
+        if not file_tests:
+            return None
+        for line in get_changed_lines(old or [], new or []):
+            line_tests = {
+                nodeid for nodeid, lines in file_tests.items() if line in lines
+            }
+            if not line_tests:
+                selected.update(file_tests)
+                break
+            selected.update(line_tests)
+    # Skip the node ids of the test files selected as a whole
+    return {
+        nodeid
+        for nodeid in selected
+        if "::" not in nodeid or nodeid.split("::")[0] not in selected
+    }
+
+
+def run_affected_tests(dependencies):
+    """Run only the tests affected by the changes since the last run."""
+    selected = get_affected_tests(load_test_impact(), dependencies)
+    if selected is not None and not selected:
+        print("No tests affected by the changes.")
+        save_test_impact(None, dependencies, selected)
+        return
+    cmd_action = PYTEST_CMD.split() + ["--cov-fail-under=0"]
+    cmd_action += sorted(selected or [])
+    env = dict(os.environ, COVERAGE_FILE=TEST_IMPACT_DATA)
+    returncode = run(cmd_action, env=env).returncode
+    if returncode != 0:
+        msg = "Command failed: '{}' returned {}"
+        return TaskFailed(msg.format(" ".join(cmd_action), returncode))
+    save_test_impact(TEST_IMPACT_DATA + "*", dependencies, selected)
+
+
+def get_tox_envs():
+    """Return the list of environments in the tox.ini envlist."""
+    config = configparser.ConfigParser(interpolation=None)
+    config.read("tox.ini")
+    return [env.strip() for env in config["tox"]["envlist"].split(",")]
+
+
+def get_python_paths(python):
+    """Return the version, site-packages and scripts paths of python."""
+    code = (
+        "import sys, sysconfig; "
+        "print(' '.join(sys.version.split())); "
+        "print(sysconfig.get_paths()['purelib']); "
+        "print(sysconfig.get_paths()['scripts'])"
+    )
+    return get_stdout([python, "-c", code]).splitlines()
+
+
+def link_tree(source, target, exclude=()):
+    """
+    Hardlink the files of the source directory into target.
+
+    The files are copied if they can't be linked (ie. other file system).
+    Existing files in target are kept. The names in the top level directory
+    matching any of the exclude patterns are skipped.
+    """
+    for dirpath, dirnames, filenames in os.walk(source):
+        if dirpath == source:
+            dirnames[:] = [
+                name
+                for name in dirnames
+                if not any(fnmatch(name, p) for p in exclude)
+            ]
+            filenames = [
+                name
+                for name in filenames
+                if not any(fnmatch(name, p) for p in exclude)
+            ]
+        target_dir = os.path.join(target, os.path.relpath(dirpath, source))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in filenames:
+            target_path = os.path.join(target_dir, name)
+            if not os.path.lexists(target_path):
+                try:
+                    os.link(os.path.join(dirpath, name), target_path)
+                except OSError:
+                    shutil.copy2(os.path.join(dirpath, name), target_path)
+
+
+def copy_scripts(source, target, python):
+    """
+    Copy the scripts of source into target pointing its shebang to python.
+
+    Symbolic links and the existing scripts in target are not copied.
+    """
+    for name in os.listdir(source):
+        source_path = os.path.join(source, name)
+        target_path = os.path.join(target, name)
+        if os.path.islink(source_path) or os.path.lexists(target_path):
+            continue
+        with open(source_path, "rb") as fo:
+            content = fo.read()
+        first_line, __, rest = content.partition(b"\n")
+        if first_line.startswith(b"#!") and b"python" in first_line:
+            content = b"#!" + python.encode() + b"\n" + rest
+        with open(target_path, "wb") as fo:
+            fo.write(content)
+        shutil.copymode(source_path, target_path)
+
+
+def get_env_key(version):
+    """Return the ENV_CACHE key for the Python version, platform and lock."""
+    if not os.path.exists("poetry.lock"):
+        return None
+    key = hashlib.sha256(version.encode())
+    # The cached compiled packages only work in the same platform
+    key.update(" ".join([sys.platform, platform.machine()]).encode())
+    key.update(get_file_hash("poetry.lock").encode())
+    return key.hexdigest()
+
+
+def get_installed_packages(site_packages):
+    """Return the distributions in site_packages other than the base ones."""
+    exclude = ENV_BASE_PACKAGES + ["{{ cookiecutter.project_slug }}*"]
+    return [
+        name
+        for name in os.listdir(site_packages)
+        if name.endswith((".dist-info", ".egg-info"))
+        and not any(fnmatch(name, pattern) for pattern in exclude)
+    ]
+
+
+def hydrate_env(python=None):
+    """
+    Install in the environment of python the cached dependencies.
+
+    The packages for the same Python version and poetry.lock in ENV_CACHE are
+    hardlinked into the environment, so a following poetry install finds all
+    the dependencies installed and don't need to download them. Only new
+    environments are hydrated, the packages of other versions would be mixed
+    with the cached ones. Defaults to the project virtual environment.
+    """
+    python = python or get_venv_python()
+    version, site_packages, scripts = get_python_paths(python)
+    key = get_env_key(version)
+    if key is None or not os.path.isdir(os.path.join(ENV_CACHE, key)):
+        return
+    key_path = os.path.join(site_packages, ENV_KEY_FILE)
+    if os.path.exists(key_path) or get_installed_packages(site_packages):
+        return
+    cached = os.path.join(ENV_CACHE, key)
+    link_tree(os.path.join(cached, "site-packages"), site_packages)
+    copy_scripts(os.path.join(cached, "scripts"), scripts, python)
+    with open(key_path, "w") as fo:
+        fo.write(key)
+
+
+def save_env(python=None):
+    """
+    Save the dependencies installed in the environment of python to ENV_CACHE.
+
+    Nothing is done if they are already cached. The project package itself is
+    excluded. Defaults to the project virtual environment.
+    """
+    python = python or get_venv_python()
+    version, site_packages, scripts = get_python_paths(python)
+    key = get_env_key(version)
+    if key is None or os.path.isdir(os.path.join(ENV_CACHE, key)):
+        return
+    os.makedirs(ENV_CACHE, exist_ok=True)
+    env_dir = tempfile.mkdtemp(dir=ENV_CACHE)
+    exclude = ENV_BASE_PACKAGES + [
+        "{{ cookiecutter.project_slug }}*",
+        "easy-install.pth",
+        ENV_KEY_FILE,
+    ]
+    link_tree(site_packages, os.path.join(env_dir, "site-packages"), exclude)
+    os.mkdir(os.path.join(env_dir, "scripts"))
+    copy_scripts(scripts, os.path.join(env_dir, "scripts"), python)
+    try:
+        os.rename(env_dir, os.path.join(ENV_CACHE, key))
+    except OSError:  # Cached by other process meanwhile
+        shutil.rmtree(env_dir)
+
+
+def get_sources_key(dependencies):
+    """Return the hash of the paths and content of the dependencies."""
+    key = hashlib.sha256()
+    for path_ in sorted(dependencies):
+        key.update(path_.encode())
+        key.update(get_file_hash(path_).encode())
+    return key.hexdigest()
+
+
+def save_coverage_key(prefix, dependencies):
+    """Record the sources measured in the coverage data files of prefix."""
+    os.makedirs(COV_KEYS, exist_ok=True)
+    with open(os.path.join(COV_KEYS, prefix), "w") as fo:
+        fo.write(get_sources_key(dependencies))
+
+
+def get_current_coverage_data(dependencies):
+    """Return the coverage data files measured on the current sources."""
+    if not os.path.isdir(COV_KEYS):
+        return []
+    key = get_sources_key(dependencies)
+    paths = []
+    for prefix in sorted(os.listdir(COV_KEYS)):
+        with open(os.path.join(COV_KEYS, prefix)) as fo:
+            if fo.read() == key:
+                paths += sorted(glob.glob(prefix + ".*"))
+    return paths
+
+
+def combine_coverage(dependencies):
+    """
+    Combine the coverage data files measured on the current sources.
+
+    The data files of the runs on older sources (ie. a tox environment not run
+    since the last changes) are kept but not combined.
+    """
+    paths = get_current_coverage_data(dependencies)
+    if not paths:
+        msg = "No coverage data of the current sources, run doit test first."
+        return TaskFailed(msg)
+    cmd_action = ["poetry", "run", "coverage", "combine", "--keep"] + paths
+    returncode = run(cmd_action).returncode
+    if returncode != 0:
+        msg = "Command failed: '{}' returned {}"
+        return TaskFailed(msg.format(" ".join(cmd_action), returncode))
+
+
+def check_coverage_combined(task, values):
+    """Return True if the coverage data files didn't change since combined."""
+    key = hashlib.md5()
+    for path_ in sorted(glob.glob(COV_DATA + ".*")):
+        key.update(path_.encode())
+        key.update(get_file_hash(path_).encode())
+    task.value_savers.append(lambda: {"data_files": key.hexdigest()})
+    return values.get("data_files") == key.hexdigest()
+
+
 def open_in_browser(file_to_open):
     """Open a file in the web browser."""
     url = "file://" + pathname2url(os.path.abspath(file_to_open))
     webbrowser.open(url)
 
 
+def outputs_exist(task, values, *patterns):
+    """Return True (updated) if every pattern matches an existing path."""
+    return all(glob.glob(pattern) for pattern in patterns)
+
+
 def targets_exists(task):
     """Return True (updated) if all task targets exists."""
     return all([os.path.exists(target) for target in task.targets])
@@ -108,15 +1074,90 @@ def get_stdout(command):
     return check_output(command, universal_newlines=True)
 
 
+@lru_cache(maxsize=None)
+def get_git_status():
+    """
+    Return the current branch and True if the working tree is clean.
+
+    Both are read from a single git status call, memoized for the doit run.
+    """
+    branch, is_clean = None, True
+    for line_ in get_stdout(GIT_STATUS_CMD).splitlines():
+        if line_.startswith("# branch.head "):
+            branch = line_.split(" ")[2]
+        elif not line_.startswith("#"):
+            is_clean = False
+    return branch, is_clean
+
+
+@lru_cache(maxsize=None)
+def get_git_branches():
+    """Return the list of local branches, memoized."""
+    return get_stdout(GIT_BRANCHES_CMD + ["refs/heads"]).split()
+
+
+def get_last_version(branch):
+    """Return the last version tag of branch and the commits count since."""
+    description = get_stdout(GIT_LAST_VERSION_CMD + [branch]).strip()
+    tag, count, _ = description.rsplit("-", 2)
+    return tag, int(count)
+
+
+def get_venv_python():
+    """Return the path of the Python in the project virtual environment."""
+    code = "import sys; print(sys.executable)"
+    return get_stdout(["poetry", "run", "python", "-c", code]).strip()
+
+
+@lru_cache(maxsize=None)
+def get_venv_version():
+    """Return the version of the project environment Python, memoized."""
+    return get_stdout(["poetry", "run", "python", "--version"]).strip()
+
+
+def get_worktree_path(branch):
+    """Return the path of the worktree with branch checked out or None."""
+    path_ = None
+    worktrees = get_stdout(["git", "worktree", "list", "--porcelain"])
+    for line_ in worktrees.splitlines():
+        if line_.startswith("worktree "):
+            path_ = line_.split(" ", 1)[1]
+        elif line_ == "branch refs/heads/" + branch:
+            return path_
+    return None
+
+
+def is_worktree_clean(branch):
+    """Return False if branch is checked out in a worktree with changes."""
+    path_ = get_worktree_path(branch)
+    if path_ is None:
+        return True
+    return not get_stdout(["git", "-C", path_, "status", "--porcelain"])
+
+
 @contextmanager
-def checkout(branch):
-    """Temporarily checkout to branch."""
-    current_branch = get_stdout(GIT_CURRENT_BRANCH_CMD).strip("\n\r ")
+def worktree(branch):
+    """
+    Yield the path of a working tree with branch checked out.
+
+    If the branch is not checked out, it is temporarily checked out in a new
+    git worktree, so the current working tree is not modified and the doit
+    file_dep states stay valid. Else git refuses a second checkout and the
+    existing worktree (maybe the current one) is used, the tasks check before
+    that it is clean.
+    """
+    path_ = get_worktree_path(branch)
+    if path_ is not None:
+        yield path_
+        return
+    temp_dir = tempfile.mkdtemp()
+    path_ = os.path.join(temp_dir, "worktree")
     try:
-        check_call(["git", "checkout", branch])
-        yield
+        check_call(["git", "worktree", "add", path_, branch])
+        yield path_
     finally:
-        check_call(["git", "checkout", current_branch])
+        shutil.rmtree(temp_dir)
+        check_call(["git", "worktree", "prune"])
 
 
 def check_merge(task):
@@ -127,17 +1168,15 @@ def check_merge(task):
     """
     task.error = None
     branch = task.pos_arg_val[0] if len(task.pos_arg_val) > 0 else "master"
-    branches = [
-        branch_.strip("* \r")
-        for branch_ in get_stdout(["git", "branch"]).strip("\n\r ").split("\n")
-    ]
-    current_branch = get_stdout(GIT_CURRENT_BRANCH_CMD).strip("\n\r ")
-    if branch not in branches:
+    current_branch, is_clean = get_git_status()
+    if branch not in get_git_branches():
         task.error = "Branch {} don't exist.".format(branch)
     elif current_branch == branch:
         task.error = "Source and targets branch are the same."
-    elif len(get_stdout(GIT_UNSTAGED_CHANGES)) > 0:
+    elif not is_clean:
         task.error = "Git working directory is not clean."
+    elif not is_worktree_clean(branch):
+        task.error = "Git worktree of {} is not clean.".format(branch)
     else:
         branch_diff = get_stdout(["git", "diff", "--name-only", branch])
         return len(branch_diff) == 0
@@ -149,31 +1188,36 @@ def do_merge(task, pos_arg_val):
     if task.error is not None:
         return TaskFailed(task.error)
     branch = pos_arg_val[0] if len(pos_arg_val) > 0 else "master"
-    with checkout(branch) as current_branch:
-        check_call(["git", "merge", "--no-ff", current_branch])
-        check_call(["git", "push", "origin", branch])
+    current_branch = get_git_status()[0]
+    with worktree(branch) as path_:
+        try:
+            check_call(["git", "merge", "--no-ff", current_branch], cwd=path_)
+        except subprocess.CalledProcessError:
+            check_call(["git", "merge", "--abort"], cwd=path_)
+            msg = (
+                "Merge of {0} into {1} failed. Run 'git merge {1}' in {0}, "
+                "resolve the conflicts, commit and run the task again."
+            )
+            return TaskFailed(msg.format(current_branch, branch))
+        check_call(["git", "push", "origin", branch], cwd=path_)
 
 
 def check_release(task):
     """
     Return uptodate (True) if there aren't unreleased commit in master branch.
 
-    First, check there aren't unstaged changes in master and current branches
-    and pass the error to do_release.
+    First, check there aren't unstaged changes in the current branch or in the
+    master worktree and pass the error to do_release.
     """
     task.error = None
-    if len(get_stdout(GIT_UNSTAGED_CHANGES)) > 0:
+    if not get_git_status()[1]:
         task.error = "Git working directory is not clean."
         return False
-    with checkout("master"):
-        if len(get_stdout(GIT_UNSTAGED_CHANGES)) > 0:
-            task.error = "Git working directory is not clean."
-            return False
-        task.last_version = get_stdout(GIT_LAST_VERSION_CMD).strip("\n\r ")
-        task.unreleased_commits = get_stdout(
-            GIT_BRIEF_LOG_CMD + [task.last_version + ".."]
-        )
-    return len(task.unreleased_commits) == 0
+    if not is_worktree_clean("master"):
+        task.error = "Git worktree of master is not clean."
+        return False
+    task.last_version, unreleased_count = get_last_version("master")
+    return unreleased_count == 0
 
 
 def do_release(task, pos_arg_val):
@@ -187,19 +1231,22 @@ def do_release(task, pos_arg_val):
     part = pos_arg_val[0]
     if part not in choices:
         return TaskFailed(msg.format("Wrong", str(choices)))
-    with checkout("master"):
+    current_branch = get_git_status()[0]
+    bump_cmd = [get_venv_python(), "-m", "bumpversion"]
+    with worktree("master") as path_:
         print("Commits since", task.last_version)
-        print(task.unreleased_commits)
-        check_call(["poetry", "run", "bump2version", "-n", "--verbose", part])
+        print(get_stdout(GIT_BRIEF_LOG_CMD + [task.last_version + "..master"]))
+        check_call(bump_cmd + ["-n", "--verbose", part], cwd=path_)
         proceed = input("Do you agree with the changes? (y/n): ")
         if proceed.lower().strip().startswith("y"):
-            check_call(["poetry", "run", "bump2version", part])
-            check_call(["git", "push", "--tags", "origin", "master"])
+            check_call(bump_cmd + [part], cwd=path_)
+            push_cmd = ["git", "push", "--tags", "origin", "master"]
+            check_call(push_cmd, cwd=path_)
         else:
             return TaskFailed("Cancelled by user.")
-    check_call(["git", "merge", "--no-ff", "master"])
-    current_branch = get_stdout(GIT_CURRENT_BRANCH_CMD).strip("\n\r ")
-    check_call(["git", "push", "origin", current_branch])
+    if current_branch != "master":
+        check_call(["git", "merge", "--no-ff", "master"])
+        check_call(["git", "push", "origin", current_branch])
 
 
 # ------------------- Installation ---------------------
@@ -242,7 +1289,7 @@ def task_install():
     """Install all dependencies in a virtual environment."""
     return {
         "file_dep": ["pyproject.toml"],
-        "actions": ["poetry install"],
+        "actions": [hydrate_env, "poetry install", save_env],
         "task_dep": ["_verchew"],
         "targets": ["poetry.lock"],
     }
@@ -251,54 +1298,124 @@ def task_install():
 # --------------------- Development ----------------------
 
 
+def task__python_files():
+    """Find the Python files. Use it through the PYTHON_FILES calc_dep."""
+    return {"actions": [find_python_files]}
+
+
+def task__docs_files():
+    """Find the documentation files. Use it through the DOCS_FILES calc_dep."""
+    return {"actions": [find_docs_files]}
+
+
+def task__package_files():
+    """Find the package files. Use it through the PACKAGE_FILES calc_dep."""
+    return {"actions": [find_package_files]}
+
+
 def task_check():
     """Show the changes that the code formatters would apply."""
     for action in [BLACK_CMD.format(diff="--diff"), "poetry run isort --diff"]:
-        yield get_subtask(action, PYTHON_FILES)
+        yield get_subtask(action, calc_dep=PYTHON_FILES)
 
 
 def task_format():
     """Run code formatters and apply it's changes."""
-    for action in [BLACK_CMD.format(diff=""), "poetry run isort -y"]:
-        yield get_subtask(action, PYTHON_FILES)
+    black = get_subtask(BLACK_CMD.format(diff=""), calc_dep=PYTHON_FILES)
+    isort = get_subtask("poetry run isort -y", calc_dep=PYTHON_FILES)
+    # Both write the same files, so they must not run concurrently
+    isort["task_dep"].append("format:black")
+    yield black
+    yield isort
 
 
 def task_style():
     """Check code styling."""
-    for action in [
-        "poetry run flake8",
-        "poetry run pydocstyle",
-        "poetry run isort --check-only -rc .",
+    for action, skip in [
+        ("poetry run flake8", None),
+        ("poetry run pydocstyle", "test_*.py"),  # pydocstyle default match
+        ("poetry run isort --check-only", None),
     ]:
-        yield get_subtask(action, PYTHON_FILES)
+        task = get_subtask(action, CONFIG_FILES, PYTHON_FILES)
+        task["actions"] = [(lint_changed, (action, task["name"], skip))]
+        yield task
 
 
 def task_test():
     """Run tests."""
     return {
         "task_dep": ["install"],
-        "file_dep": PYTHON_FILES,
-        "actions": ["poetry run pytest --cov --cov-config=tox.ini"],
+        "file_dep": CONFIG_FILES + ["poetry.lock"],
+        "calc_dep": PYTHON_FILES,
+        "actions": [
+            (
+                run_cached,
+                (PYTEST_CMD, [COV_TEST_DATA + "*", SLOW_TESTS]),
+                {"env": {"COVERAGE_FILE": COV_TEST_DATA}},
+            ),
+            (save_test_impact, (COV_TEST_DATA + "*",)),
+            (save_coverage_key, (COV_TEST_DATA,)),
+        ],
     }
 
 
-def task_test_all():
-    """Run tests with tox using different Python versions."""
+def task_test_affected():
+    """Run only the tests affected by the changes since the last run."""
     return {
-        "basename": "test-all",
+        "basename": "test-affected",
         "task_dep": ["install"],
-        "file_dep": PYTHON_FILES,
-        "actions": ["poetry run tox"],
+        "file_dep": CONFIG_FILES,
+        "calc_dep": PYTHON_FILES,
+        "actions": [run_affected_tests],
     }
 
 
+def task_test_all():
+    """Run tests with tox using different Python versions."""
+    envs = get_tox_envs()
+    for env in envs:
+        tox_cmd = "poetry run tox -e " + env
+        python = os.path.join(".tox", env, "bin", "python")
+        task_dep = ["install"]
+        actions = [
+            tox_cmd + " --notest",
+            (hydrate_env, (python,)),
+            tox_cmd,
+            (save_env, (python,)),
+        ]
+        if env == "docs":  # Its coverage report combines the other envs data
+            task_dep += ["test-all:" + other for other in envs if other != env]
+        else:
+            actions.append((save_coverage_key, (COV_DATA + "." + env,)))
+        yield {
+            "basename": "test-all",
+            "name": env,
+            "task_dep": task_dep,
+            "file_dep": CONFIG_FILES + ["poetry.lock"],
+            "calc_dep": PYTHON_FILES,
+            "actions": actions,
+            # The output is captured and only shown if the environment fails
+            "verbosity": 1,
+        }
+
+
 def task_coverage():
     """Generate and show the coverage html report."""
+    yield {
+        "name": "combine",
+        # Only the existing data, run test or test-all before to update it
+        "task_dep": ["install"],
+        # The same dependencies than test and test-all, see combine_coverage
+        "file_dep": CONFIG_FILES + ["poetry.lock"],
+        "calc_dep": PYTHON_FILES,
+        "uptodate": [check_coverage_combined],
+        "actions": [combine_coverage],
+        "targets": [COV_DATA],
+    }
     yield {
         "name": "build",
-        "task_dep": ["test"],
-        "file_dep": [".coverage"],
-        "actions": ["poetry run coverage html"],
+        "file_dep": [COV_DATA, "tox.ini"],
+        "actions": [(run_cached, ("poetry run coverage html", [COV_HTML]))],
         "targets": [COV_HTML, COV_INDEX],
     }
     yield {
@@ -310,28 +1427,31 @@ def task_coverage():
 
 def task_docs():
     """Generate and show the HTML documentation."""
-{% if cookiecutter.docs_generator == "Sphinx" %}    to_clean = [
+{% if cookiecutter.docs_generator == "Sphinx" %}    api_dir = os.path.join("docs", "api")
+    to_clean = [
         DOCS_HTML,
-        os.path.join("docs", "api", "{{cookiecutter.project_slug}}*.rst"),
-        os.path.join("docs", "api", "modules.rst"),
+        os.path.join(api_dir, "{{cookiecutter.project_slug}}*.rst"),
+        os.path.join(api_dir, "modules.rst"),
     ]
-    apidoc_cmd = "poetry run sphinx-apidoc -o docs/api {{ cookiecutter.project_slug }}"
     yield {
         "name": "build",
         "task_dep": ["install"],
-        "file_dep": DOCS_FILES,
+        # Rebuild on docstring changes too, autodoc tracks the modules
+        "calc_dep": DOCS_FILES + PYTHON_FILES,
         "actions": [
-            (clean_paths, to_clean),
-            apidoc_cmd,
-            "poetry run sphinx-build -b html -j auto -a docs site",
-            (copy_directory, (os.path.join("docs", "htmlcov"), DOCS_HTML)),
+            (
+                update_apidoc,
+                ("{{ cookiecutter.project_slug }}", api_dir, run_apidoc),
+            ),
+            "poetry run sphinx-build -b html -j auto docs site",
+            (update_directory, (COV_HTML, DOCS_HTML)),
         ],
         "targets": [DOCS_HTML, DOCS_INDEX],
         "clean": [(clean_paths, to_clean)],
 {% else %}    yield {
         "name": "build",
         "task_dep": ["install"],
-        "file_dep": DOCS_FILES,
+        "calc_dep": DOCS_FILES,
         "actions": ["poetry run mkdocs build"],
         "targets": [DOCS_HTML, DOCS_INDEX],
 {% endif %}    }
@@ -344,8 +1464,7 @@ def task_docs():
 
 def task_serve_docs():
     """Show the documentation and coverage watching for changes."""
-{% if cookiecutter.docs_generator == "Sphinx" %}    serve_docs = os.path.join("bin", "serve-docs")
-    serve_cmd = "poetry run python " + serve_docs
+{% if cookiecutter.docs_generator == "Sphinx" %}    serve_cmd = "poetry run python " + SERVE_DOCS
     return {
         "basename": "serve-docs",
         "task_dep": ["coverage:build", "docs:build"],
@@ -358,6 +1477,57 @@ def task_serve_docs():
     }
 {% endif %}
 
+def task_profile():
+    """Show the slowest tasks, their trends and the critical path."""
+    return {
+        "actions": [show_profile],
+        "params": [
+            {
+                "name": "runs",
+                "short": "r",
+                "long": "runs",
+                "type": int,
+                "default": PROFILE_RUNS,
+                "help": "number of last runs to summarize",
+            }
+        ],
+        "uptodate": [False],
+    }
+
+
+def task_importtime():
+    """Show the import time of the package and check its budget."""
+    return {
+        "task_dep": ["install"],
+        "actions": [(check_import_time, (IMPORT_MODULES,))],
+        "params": [
+            {
+                "name": "budget",
+                "short": "b",
+                "long": "budget",
+                "type": float,
+                "default": IMPORT_TIME_BUDGET,
+                "help": "maximum import time in seconds",
+            }
+        ],
+        "uptodate": [False],
+    }
+
+
+def task_benchmark():
+    """Run the micro-benchmarks of the registry and the command."""
+    benchmarks = ["registry"]
+{% if cookiecutter.command_line_interface == "Click" %}    benchmarks.append("cli")
+{% endif %}    for name in benchmarks:
+        benchmark = os.path.join("bin", "benchmark-" + name)
+        yield {
+            "name": name,
+            "task_dep": ["install"],
+            "actions": ["poetry run python " + benchmark],
+            "uptodate": [False],
+            "verbosity": 2,
+        }
+
 # -------------------- Release ------------------------
 
 
@@ -381,9 +1551,37 @@ def task_release():
     }
 
 
+def build_package(format_, suffix, dependencies):
+    """Build the format_ distribution with poetry through run_cached."""
+    return run_cached(
+        "poetry build -f " + format_,
+        [get_dist_pattern(suffix)],
+        dependencies,
+        env={"SOURCE_DATE_EPOCH": BUILD_EPOCH},
+    )
+
+
+def dist_exists(task, values, suffix):
+    """Return True (updated) if the distribution file exists."""
+    return outputs_exist(task, values, get_dist_pattern(suffix))
+
+
+def clean_dist(suffix):
+    """Delete the distribution file."""
+    clean_paths(get_dist_pattern(suffix))
+
+
 def task_build():
     """Build source and wheel package."""
-    return {"task_dep": ["test-all"], "actions": ["poetry build"]}
+    for format_, suffix in [("sdist", ".tar.gz"), ("wheel", "-*.whl")]:
+        yield {
+            "name": format_,
+            "task_dep": ["test-all"],
+            "calc_dep": PACKAGE_FILES,
+            "actions": [(build_package, (format_, suffix))],
+            "uptodate": [(dist_exists, (suffix,))],
+            "clean": [(clean_dist, (suffix,))],
+        }
 
 
 def show_task_doc(task):
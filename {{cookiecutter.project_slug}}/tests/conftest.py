@@ -0,0 +1,99 @@
+"""
+Duration budget for the tests.
+
+Fail the tests that run longer than the `duration_budget` option of the
+[pytest] section in tox.ini (seconds, 0 to disable). Use the
+`duration_budget(seconds)` marker to set a different budget for a test.
+The duration of every test is kept in the pytest cache, the slowest ones are
+listed in the `duration_report` file and `--slowest-first` runs first the
+tests that were slower in their last run.
+"""
+import os
+
+import pytest
+
+DURATIONS_KEY = "durations/history"
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "duration_budget",
+        "fail the tests running longer than this seconds (0 to disable)",
+        default="0",
+    )
+    parser.addini(
+        "duration_report", "file to write the slowest tests", default=""
+    )
+    parser.addini(
+        "duration_report_size", "number of tests in the report", default="20"
+    )
+    parser.addoption(
+        "--slowest-first",
+        action="store_true",
+        help="run first the tests that were slower in their last run",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "duration_budget(seconds): duration budget of the test"
+    )
+    config.pluginmanager.register(DurationBudget(config), "duration_budget")
+
+
+class DurationBudget(object):
+    """Plugin to enforce the duration budget and report the slowest tests."""
+
+    def __init__(self, config):
+        self.config = config
+        self.budget = float(config.getini("duration_budget"))
+        self.cache = getattr(config, "cache", None)
+        self.history = {}
+        if self.cache is not None:
+            self.history = self.cache.get(DURATIONS_KEY, {})
+        self.durations = {}
+
+    def pytest_collection_modifyitems(self, items):
+        if self.config.getoption("slowest_first"):
+            items.sort(key=lambda item: -self.history.get(item.nodeid, 0.0))
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        marker = item.get_closest_marker("duration_budget")
+        budget = marker.args[0] if marker else self.budget
+        if report.when == "call" and report.passed:
+            if 0 < budget < report.duration:
+                report.outcome = "failed"
+                msg = "Test took {:.3f}s, over its duration budget of {:.3f}s"
+                report.longrepr = msg.format(report.duration, budget)
+
+    def pytest_runtest_logreport(self, report):
+        if report.when == "call":
+            self.durations[report.nodeid] = report.duration
+
+    def pytest_sessionfinish(self, session):
+        if hasattr(self.config, "workerinput") or not self.durations:
+            return  # Under pytest-xdist the controller gets all the reports
+        self.history.update(self.durations)
+        if self.cache is not None:
+            self.cache.set(DURATIONS_KEY, self.history)
+        report_path = self.config.getini("duration_report")
+        if report_path:
+            self.write_report(report_path)
+
+    def write_report(self, report_path):
+        """Write the slowest tests of this session to report_path."""
+        size = int(self.config.getini("duration_report_size"))
+        slowest = sorted(
+            self.durations.items(), key=lambda item: item[1], reverse=True
+        )[:size]
+        report_path = os.path.join(str(self.config.rootdir), report_path)
+        if not os.path.isdir(os.path.dirname(report_path)):
+            os.makedirs(os.path.dirname(report_path))
+        with open(report_path, "w") as fo:
+            msg = "Slowest tests (duration budget {:.3f}s)\n\n"
+            fo.write(msg.format(self.budget))
+            for nodeid, duration in slowest:
+                fo.write("{:>9.3f}s  {}\n".format(duration, nodeid))
@@ -1,4 +1,8 @@
 # -*- coding=utf-8 -*-
+import io
+import subprocess
+import sys
+
 from click.testing import CliRunner
 
 from {{cookiecutter.project_slug}} import cli
@@ -8,3 +12,40 @@ def test_emoji():
     runner = CliRunner()
     output = runner.invoke(cli.emoji, ["-e", "snek", "-c", "3"]).output
     assert output == u"🐍🐍🐍\n"
+
+
+def test_emoji_large_count():
+    runner = CliRunner()
+    output = runner.invoke(cli.emoji, ["-e", "monky", "-c", "100000"]).output
+    assert output == u"🐒" * 100000 + u"\n"
+
+
+def test_write_repeated():
+    stream = io.BytesIO()
+    cli.write_repeated(stream, b"ab", 7, chunk_size=4)
+    assert stream.getvalue() == b"ab" * 7
+
+
+def test_emoji_batch():
+    runner = CliRunner()
+    requests = u"snek 2\n\nmonky\nrabit 0\n"
+    result = runner.invoke(cli.emoji, ["--batch", "-"], input=requests)
+    assert result.output == u"🐍🐍\n🐒\n\n"
+    requests = u"snek 2\nsnek x\n"
+    result = runner.invoke(cli.emoji, ["--batch", "-"], input=requests)
+    assert result.exit_code == 2
+    assert "line 2" in result.output
+    assert u"🐍" not in result.output
+
+
+def test_emoji_closed_pipe():
+    cmd = [sys.executable, "-m", "{{cookiecutter.project_slug}}.cli"]
+    process = subprocess.Popen(
+        cmd + ["-e", "snek", "-c", "10000000"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    assert process.stdout.read(8) == u"🐍🐍".encode("utf-8")
+    process.stdout.close()
+    assert process.wait() == 0
+    assert process.stderr.read() == b""
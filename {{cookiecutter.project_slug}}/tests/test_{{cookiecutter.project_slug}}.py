@@ -1,6 +1,58 @@
 # -*- coding=utf-8 -*-
+import subprocess
+import sys
+
+import pytest
+
 from {{cookiecutter.project_slug}} import {{cookiecutter.project_slug}}
 
 
 def test_get_emoji():
-    assert {{cookiecutter.project_slug}}.get_emojis()["snek"] == "🐍"
+    assert {{cookiecutter.project_slug}}.get_emojis()["snek"] == u"🐍"
+
+
+def test_lookup():
+    assert {{cookiecutter.project_slug}}.lookup("snek") == u"🐍"
+    assert {{cookiecutter.project_slug}}.lookup("snake") == u"🐍"
+    with pytest.raises(KeyError):
+        {{cookiecutter.project_slug}}.lookup("dragon")
+
+
+def test_lookup_many():
+    names = ["monkey", "snek", "monky"]
+    emojis = {{cookiecutter.project_slug}}.lookup_many(names)
+    assert emojis == [u"🐒", u"🐍", u"🐒"]
+
+
+def test_complete():
+    assert {{cookiecutter.project_slug}}.complete("r") == ("rabbit", "rabit")
+    assert {{cookiecutter.project_slug}}.complete("rabb") == ("rabbit",)
+    assert {{cookiecutter.project_slug}}.complete("x") == ()
+    assert len({{cookiecutter.project_slug}}.complete("")) == 6
+
+
+def test_registry_is_read_only():
+    with pytest.raises(TypeError):
+        {{cookiecutter.project_slug}}.EMOJIS["dragon"] = u"🐉"
+
+
+def test_submodules():
+    code = (
+        "import {{cookiecutter.project_slug}}\n"
+        "assert {{cookiecutter.project_slug}}.{{cookiecutter.project_slug}}.lookup('snek')\n"
+{%- if cookiecutter.command_line_interface == "Click" %}
+        "assert {{cookiecutter.project_slug}}.cli.emoji\n"
+{%- endif %}
+    )
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="requires PEP 562")
+def test_lazy_submodules():
+    code = (
+        "import sys, {{cookiecutter.project_slug}}\n"
+        "assert '{{cookiecutter.project_slug}}.{{cookiecutter.project_slug}}' not in sys.modules\n"
+        "assert {{cookiecutter.project_slug}}.{{cookiecutter.project_slug}}.lookup('snek')\n"
+        "assert 'click' not in sys.modules\n"
+    )
+    subprocess.check_call([sys.executable, "-c", code])
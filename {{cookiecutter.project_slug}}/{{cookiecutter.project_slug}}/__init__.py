@@ -1,7 +1,35 @@
 # -*- coding: utf-8 -*-
-"""Top-level package for {{ cookiecutter.project_name }}."""
+"""
+Top-level package for {{ cookiecutter.project_name }}.
+
+The submodules are imported on first access as attributes of the package
+(Python 3.7+), importing the package alone doesn't load them or their
+dependencies. Older versions import them with the package.
+"""
+import importlib
+import sys
 
 __author__ = "{{ cookiecutter.full_name }}"
 __email__ = "{{ cookiecutter.email }}"
 __version__ = "{{ cookiecutter.version }}"
 __copyright__ = "Copyright (c) {% now 'local', '%Y'%} {{ cookiecutter.full_name if cookiecutter._company == '' else cookiecutter._company }}"
+
+# Submodules imported on first access
+_SUBMODULES = ("{{ cookiecutter.project_slug }}",{% if cookiecutter.command_line_interface == "Click" %} "cli"{% endif %})
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_SUBMODULES))
+
+
+if sys.version_info < (3, 7):  # No module __getattr__ (PEP 562)
+    for _name in _SUBMODULES:
+        importlib.import_module("." + _name, __name__)
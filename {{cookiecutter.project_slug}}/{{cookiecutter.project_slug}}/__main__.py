@@ -1,5 +1,5 @@
 """Run the package when using the python command line -m option."""
-from cli import emoji
+from {{cookiecutter.project_slug}}.cli import emoji
 
 if __name__ == "__main__":
     emoji()
@@ -3,24 +3,101 @@
 
 from __future__ import absolute_import
 
+import errno
+import os
 import sys
+from itertools import repeat
 
 import click
 
-from {{cookiecutter.project_slug}}.{{cookiecutter.project_slug}} import get_emojis
+from {{cookiecutter.project_slug}}.{{cookiecutter.project_slug}} import complete, lookup_many
+
+# Bytes written to stdout at once
+CHUNK_SIZE = 64 * 1024
+# Names and aliases of the emojis
+NAMES = complete("")
+# Emoji of each name and alias encoded for the binary stdout
+ENCODED = {
+    name: emoji.encode("utf-8")
+    for name, emoji in zip(NAMES, lookup_many(NAMES))
+}
+
+
+def write_repeated(stream, data, count, chunk_size=CHUNK_SIZE):
+    """Write data count times to a binary stream in chunks of bounded size."""
+    if count <= 0:
+        return
+    per_chunk = max(1, chunk_size // len(data))
+    full_chunks, rest = divmod(count, per_chunk)
+    for chunk in repeat(data * per_chunk, full_chunks):
+        stream.write(chunk)
+    stream.write(data * rest)
+
+
+def write_batch(stream, lines, encoded=ENCODED, block_size=CHUNK_SIZE):
+    """
+    Write the emojis requested in 'emoji [count]' lines, one result per line.
+
+    The requests are validated against the encoded emojis dict and the results
+    are written to the binary stream in blocks of about block_size bytes.
+    """
+    block = bytearray()
+    for number, line in enumerate(lines, 1):
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            name, count = fields if len(fields) == 2 else fields + ["1"]
+            data, count = encoded[name], int(count)
+        except (KeyError, ValueError):
+            msg = "line {}: expected 'emoji [count]', got '{}'"
+            raise click.BadParameter(
+                msg.format(number, line.strip()), param_hint="'--batch'"
+            )
+        if len(data) * count > block_size:
+            stream.write(block)
+            del block[:]
+            write_repeated(stream, data, count, block_size)
+        else:
+            block += data * count
+        block += b"\n"
+        if len(block) >= block_size:
+            stream.write(block)
+            del block[:]
+    stream.write(block)
 
 
 @click.command()
 @click.option(
     "-e",
     "--emoji",
-    required=True,
-    type=click.Choice(get_emojis().keys()),
+    type=click.Choice(NAMES),
     help="The emoji to show.",
 )
 @click.option("-c", "--count", default=1, help="Number of emojis.")
-def emoji(emoji, count=1):
-    click.echo(get_emojis()[emoji] * count)
+@click.option(
+    "-b",
+    "--batch",
+    type=click.File("r"),
+    help="Read 'emoji [count]' lines from a file (- for stdin).",
+)
+def emoji(emoji=None, count=1, batch=None):
+    if batch is None and emoji is None:
+        raise click.UsageError('Missing option "-e" / "--emoji".')
+    stdout = getattr(sys.stdout, "buffer", sys.stdout)
+    try:
+        if batch is not None:
+            write_batch(stdout, batch)
+        else:
+            write_repeated(stdout, ENCODED[emoji], count)
+            stdout.write(b"\n")
+        stdout.flush()
+    except IOError as error:
+        if error.errno != errno.EPIPE:
+            raise
+        # The reader closed the pipe, also discard the flush at the exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, stdout.fileno())
 
 
 if __name__ == "__main__":
@@ -1,7 +1,73 @@
 # -*- coding=utf-8 -*-
 """{{cookiecutter.project_name}} core module."""
 
+try:
+    from types import MappingProxyType
+except ImportError:  # Python 2
+    from collections import Mapping
+
+    class MappingProxyType(Mapping):
+        """Read-only view of a dict."""
+
+        def __init__(self, mapping):
+            self._mapping = mapping
+
+        def __getitem__(self, key):
+            return self._mapping[key]
+
+        def __iter__(self):
+            return iter(self._mapping)
+
+        def __len__(self):
+            return len(self._mapping)
+
+
+# Name, emoji and aliases of each entry of the registry
+_REGISTRY = (
+    ("snek", u"🐍", ("snake",)),
+    ("rabit", u"🐰", ("rabbit",)),
+    ("monky", u"🐒", ("monkey",)),
+)
+
+# Emoji of each name
+EMOJIS = MappingProxyType({name: emoji for name, emoji, __ in _REGISTRY})
+# Name of each alias
+ALIASES = MappingProxyType(
+    {alias: name for name, __, aliases in _REGISTRY for alias in aliases}
+)
+# Emoji of each name and alias
+_INDEX = dict(EMOJIS)
+_INDEX.update((alias, EMOJIS[name]) for alias, name in ALIASES.items())
+
+
+def _index_prefixes(keys):
+    """Return the sorted tuple of keys starting with each prefix."""
+    prefixes = {}
+    for key in sorted(keys):
+        for end in range(len(key) + 1):
+            prefixes.setdefault(key[:end], []).append(key)
+    return {prefix: tuple(matches) for prefix, matches in prefixes.items()}
+
+
+# Sorted names and aliases starting with each prefix
+_PREFIXES = _index_prefixes(_INDEX)
+
 
 def get_emojis():
-    """Return a dict of emojis."""
-    return dict(snek="🐍", rabit="🐰", monky="🐒")
+    """Return the read-only mapping of names to emojis."""
+    return EMOJIS
+
+
+def lookup(name):
+    """Return the emoji of a name or alias, raise KeyError if unknown."""
+    return _INDEX[name]
+
+
+def lookup_many(names):
+    """Return the list of emojis of an iterable of names or aliases."""
+    return list(map(_INDEX.__getitem__, names))
+
+
+def complete(prefix):
+    """Return the sorted names and aliases starting with prefix."""
+    return _PREFIXES.get(prefix, ())